@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+import os
 import subprocess
 import sys
 
@@ -14,7 +15,7 @@ class AppConfig(AppConfig):
                 "-m",
                 "app.gemini.ocr_worker",
                 "__warmup__",
-                "NUL",
+                os.devnull,
             ],
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
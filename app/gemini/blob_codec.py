@@ -0,0 +1,48 @@
+# app/gemini/blob_codec.py
+# ============================================================
+# Compression for blobs stored on InvoiceExtraction
+# ============================================================
+#
+# zstd (python "zstandard") when installed, zlib otherwise. The first
+# byte records the codec so rows written by either stay readable.
+
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+BLOB_ZSTD_LEVEL = int(os.getenv("BLOB_ZSTD_LEVEL", "9"))
+BLOB_ZLIB_LEVEL = 6
+
+CODEC_ZLIB = b"Z"
+CODEC_ZSTD = b"S"
+
+
+def compress_blob(data: bytes) -> bytes:
+    if zstandard is not None:
+        return CODEC_ZSTD + zstandard.ZstdCompressor(level=BLOB_ZSTD_LEVEL).compress(data)
+    return CODEC_ZLIB + zlib.compress(data, BLOB_ZLIB_LEVEL)
+
+
+def decompress_blob(blob) -> bytes:
+    blob = bytes(blob)
+    codec, payload = blob[:1], blob[1:]
+
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    raise ValueError(f"Unknown blob codec {codec!r}")
+
+
+def compress_text(text: str) -> bytes:
+    return compress_blob(text.encode("utf-8"))
+
+
+def decompress_text(blob) -> str:
+    return decompress_blob(blob).decode("utf-8") if blob else ""
@@ -1,7 +1,18 @@
 # app/gemini/builder.py
 
+import os
+import json
+import hashlib
+import threading
+from dataclasses import dataclass
+
 from app.models import CustomExtractionField
 from app.gemini.prompts import SYSTEM_PROMPT, INVOICE_EXTRACTION_MASTER_PROMPT
+from app.gemini.lenient_json import TruncatedJSON, loads_lenient
+
+# Send a response schema (typed JSON from the provider) instead of the
+# JSON template + "NO markdown" output instructions
+GEMINI_STRUCTURED_OUTPUT = os.getenv("GEMINI_STRUCTURED_OUTPUT", "1") == "1"
 
 # ============================================================
 # Typed defaults (CRITICAL – DO NOT CHANGE)
@@ -29,25 +40,225 @@ def _json_default(value):
 
 
 # ============================================================
-# Prompt Builder
+# Type coercers (applied to Gemini output before storing)
 # ============================================================
+# Conservative: a value that cannot be read as the field's type is
+# kept as returned, so nothing the model saw is thrown away.
+
+_TRUE = {"true", "yes", "y", "1"}
+_FALSE = {"false", "no", "n", "0"}
+
+
+def _coerce_string(value):
+    return DEFAULT_VALUE["string"] if value is None else str(value).strip()
+
+
+def _coerce_number(value):
+    if value is None or isinstance(value, bool):
+        return DEFAULT_VALUE["number"]
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).replace(",", "").strip()
+    try:
+        number = float(text)
+    except ValueError:
+        return value
+    return int(number) if number.is_integer() and "." not in text else number
+
+
+def _coerce_date(value):
+    if value is None or str(value).strip() in ("", "-"):
+        return DEFAULT_VALUE["date"]
+    return str(value).strip()
 
-def build_invoice_prompt(ocr_text: str) -> str:
-    fields = CustomExtractionField.objects.filter(is_required=True)
-    if not fields.exists():
+
+def _coerce_boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE or not text or text == "-":
+        return False
+    return value
+
+
+COERCERS = {
+    "string": _coerce_string,
+    "number": _coerce_number,
+    "date": _coerce_date,
+    "boolean": _coerce_boolean,
+}
+
+# Gemini response_schema (OpenAPI subset) per field type
+RESPONSE_TYPES = {
+    "string": {"type": "STRING"},
+    "number": {"type": "NUMBER"},
+    "date": {"type": "STRING", "nullable": True, "description": "YYYY-MM-DD if possible, null if absent"},
+    "boolean": {"type": "BOOLEAN"},
+}
+
+
+# ============================================================
+# Compiled extraction schema
+# ============================================================
+# Required CustomExtractionFields are read once and compiled into the
+# prompt pieces, response schemas, allowed keys and coercers. Recompiled
+# at the start of each batch and whenever a field is saved or deleted
+# (app/signals.py).
+
+@dataclass(frozen=True)
+class ExtractionSchema:
+    fields: tuple             # ((name, field_type), ...)
+    field_instructions: tuple
+    json_template: str        # {"name": default, ...}
+    allowed_keys: frozenset
+    coercers: dict
+    defaults: dict
+    response_schema: dict     # one invoice
+    packed_response_schema: dict   # [{"document_id", "fields"}]
+    prompt_head: str          # build_invoice_prompt up to the OCR text
+    prompt_tail: str          # ... and after it
+    structured_tail: str      # ... and after it, structured-output mode
+
+    def prompt(self, ocr_text: str, structured=False) -> str:
+        tail = self.structured_tail if structured else self.prompt_tail
+        return "".join((self.prompt_head, ocr_text, tail))
+
+    def prompt_hash(self, structured=False) -> str:
+        """
+        sha256 of everything sent around the OCR text (and the response
+        schema in structured mode) – any wording or field change yields
+        a new LLM cache key.
+        """
+        tail = self.structured_tail if structured else self.prompt_tail
+        parts = [self.prompt_head, tail, "structured" if structured else "text"]
+        if structured:
+            parts.append(json.dumps(self.response_schema, sort_keys=True))
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def clean(self, data: dict) -> dict:
+        """
+        One pass over the required fields: unknown keys dropped, missing
+        ones set to their default, values coerced to the field type.
+        """
+        return {
+            name: self.coercers[name](data[name]) if name in data else self.defaults[name]
+            for name, _ in self.fields
+        }
+
+    def parse(self, output: str) -> dict:
+        """
+        Model output → cleaned fields (strict JSON first, lenient fallback).
+        Truncated output is accepted only if every required field was read
+        – otherwise clean() would silently default the rest.
+        """
+        try:
+            data = loads_lenient(output)
+        except TruncatedJSON as e:
+            data = e.partial
+            if not self.is_complete(data):
+                raise
+        if not isinstance(data, dict):
+            raise ValueError("Gemini did not return a JSON object")
+        return self.clean(data)
+
+    def is_complete(self, data) -> bool:
+        return isinstance(data, dict) and self.allowed_keys <= data.keys()
+
+
+def compile_schema(fields) -> ExtractionSchema:
+    """`fields` is [(name, field_type), ...] of the required fields."""
+    fields = tuple(fields)
+    if not fields:
         raise ValueError("No custom extraction fields configured")
 
-    field_instructions = []
-    json_schema = []
+    field_instructions = tuple(
+        f'- "{name}" (type: {field_type}, default: {DEFAULT_VALUE[field_type]})'
+        for name, field_type in fields
+    )
+    json_schema = ", ".join(
+        f'"{name}": {_json_default(DEFAULT_VALUE[field_type])}'
+        for name, field_type in fields
+    )
+
+    head = f"""
+{_rules_block(field_instructions)}
+
+==================== RAW OCR TEXT ====================
+
+--- RAW OCR TEXT START ---
+"""
+    tail = f"""
+--- RAW OCR TEXT END ---
+
+==================== OUTPUT FORMAT ====================
+
+Return STRICTLY VALID JSON.
+NO markdown.
+NO comments.
+NO explanations.
+
+{{
+{json_schema}
+}}
+"""
+
+    response_schema = {
+        "type": "OBJECT",
+        "properties": {name: RESPONSE_TYPES[field_type] for name, field_type in fields},
+        "required": [name for name, _ in fields],
+        "propertyOrdering": [name for name, _ in fields],
+    }
+
+    return ExtractionSchema(
+        fields=fields,
+        field_instructions=field_instructions,
+        json_template="{" + json_schema + "}",
+        allowed_keys=frozenset(name for name, _ in fields),
+        coercers={name: COERCERS[field_type] for name, field_type in fields},
+        defaults={name: DEFAULT_VALUE[field_type] for name, field_type in fields},
+        response_schema=response_schema,
+        packed_response_schema={
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"document_id": {"type": "STRING"}, "fields": response_schema},
+                "required": ["document_id", "fields"],
+            },
+        },
+        prompt_head=head.lstrip(),
+        prompt_tail=tail.rstrip(),
+        structured_tail="\n--- RAW OCR TEXT END ---",
+    )
+
+
+_schema = None
+_schema_lock = threading.Lock()
+
+
+def get_extraction_schema(refresh=False) -> ExtractionSchema:
+    global _schema
+    with _schema_lock:
+        if _schema is None or refresh:
+            fields = CustomExtractionField.objects.filter(is_required=True).order_by("id")
+            _schema = compile_schema(fields.values_list("name", "field_type"))
+        return _schema
 
-    for f in fields:
-        field_instructions.append(
-            f'- "{f.name}" (type: {f.field_type}, default: {DEFAULT_VALUE[f.field_type]})'
-        )
-        json_schema.append(
-            f'"{f.name}": {_json_default(DEFAULT_VALUE[f.field_type])}'
-        )
 
+def invalidate_extraction_schema():
+    global _schema
+    with _schema_lock:
+        _schema = None
+
+
+# ============================================================
+# Prompt Builder
+# ============================================================
+
+
+def _rules_block(field_instructions) -> str:
+    """System prompt, master prompt and rules – shared by single and packed prompts."""
     return f"""
 {SYSTEM_PROMPT}
 
@@ -82,22 +293,63 @@ def build_invoice_prompt(ocr_text: str) -> str:
 The output JSON MUST contain EXACTLY these fields.
 DO NOT add, remove, or rename fields.
 
-{chr(10).join(field_instructions)}
+{chr(10).join(field_instructions)}"""
 
-==================== RAW OCR TEXT ====================
 
---- RAW OCR TEXT START ---
-{ocr_text}
---- RAW OCR TEXT END ---
+def build_invoice_prompt(ocr_text: str, structured=GEMINI_STRUCTURED_OUTPUT, schema=None) -> str:
+    return (schema or get_extraction_schema()).prompt(ocr_text, structured)
 
-==================== OUTPUT FORMAT ====================
 
-Return STRICTLY VALID JSON.
+# ============================================================
+# Packed Prompt Builder (several invoices, one request)
+# ============================================================
+
+def build_packed_invoice_prompt(documents: list, structured=GEMINI_STRUCTURED_OUTPUT, schema=None) -> str:
+    """
+    One prompt for several OCR texts. `documents` is [(doc_id, ocr_text)];
+    the model answers with a JSON array of {"document_id", "fields"}.
+    `schema` defaults to the current compiled ExtractionSchema.
+    """
+    compiled = schema or get_extraction_schema()
+    schema = compiled.json_template
+
+    blocks = "\n\n".join(
+        f"--- DOCUMENT {doc_id} START ---\n{text}\n--- DOCUMENT {doc_id} END ---"
+        for doc_id, text in documents
+    )
+    example = ",\n".join(
+        f'{{"document_id": "{doc_id}", "fields": {schema}}}' for doc_id, _ in documents
+    )
+
+    if structured:
+        output_format = f"""Return EXACTLY one array item per document, with "document_id" set to its ID
+({", ".join(doc_id for doc_id, _ in documents)})."""
+    else:
+        output_format = f"""Return STRICTLY VALID JSON: an array with EXACTLY one object per document.
+Each "fields" object MUST contain EXACTLY the required fields.
 NO markdown.
 NO comments.
 NO explanations.
 
-{{
-{", ".join(json_schema)}
-}}
+[
+{example}
+]"""
+
+    return f"""
+{_rules_block(compiled.field_instructions)}
+
+==================== PACKED DOCUMENTS ====================
+
+The RAW OCR TEXT of {len(documents)} SEPARATE documents follows.
+
+- Each document is independent – extract its fields ONLY from its own text.
+- NEVER copy or carry values between documents.
+- Apply ALL rules above to every document separately.
+- A document that is NOT an invoice gets the default values only.
+
+{blocks}
+
+==================== OUTPUT FORMAT ====================
+
+{output_format}
 """.strip()
@@ -0,0 +1,189 @@
+# app/gemini/downloader.py
+# ============================================================
+# Pooled invoice downloader
+#   • one keep-alive Session per process (connection reuse)
+#   • per-host concurrency caps
+#   • separate connect / read timeouts
+#   • bounded prefetch so OCR threads never wait on the network
+#   • streamed bodies with a hard size cap + magic-byte sniffing
+# ============================================================
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT", "5"))
+DOWNLOAD_READ_TIMEOUT = float(os.getenv("DOWNLOAD_READ_TIMEOUT", "20"))
+DOWNLOAD_PER_HOST = int(os.getenv("DOWNLOAD_PER_HOST", "4"))
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_LOOKAHEAD = int(os.getenv("DOWNLOAD_LOOKAHEAD", "20"))
+DOWNLOAD_MAX_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", str(30 * 1024 * 1024)))
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Leading bytes of every format we can OCR
+MAGIC_NUMBERS = {
+    b"\xff\xd8\xff": "jpeg",
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"%PDF-": "pdf",
+    b"GIF87a": "gif",
+    b"GIF89a": "gif",
+    b"BM": "bmp",
+    b"II*\x00": "tiff",
+    b"MM\x00*": "tiff",
+}
+
+
+class DownloadError(ValueError):
+    """The URL did not yield a usable invoice file."""
+
+
+def sniff_format(head: bytes):
+    for magic, fmt in MAGIC_NUMBERS.items():
+        if head.startswith(magic):
+            return fmt
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if b"%PDF-" in head[:1024]:
+        return "pdf"
+    return None
+
+
+class Downloader:
+
+    def __init__(self, connect_timeout=DOWNLOAD_CONNECT_TIMEOUT, read_timeout=DOWNLOAD_READ_TIMEOUT,
+                 per_host=DOWNLOAD_PER_HOST, pool_size=DOWNLOAD_WORKERS, max_bytes=DOWNLOAD_MAX_BYTES):
+        self.timeout = (connect_timeout, read_timeout)
+        self.per_host = max(1, per_host)
+        self.max_bytes = max_bytes
+
+        retry = Retry(
+            total=2,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=("GET",),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=max(pool_size, self.per_host),
+            max_retries=retry,
+        )
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._host_slots = {}
+        self._lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_slots[host]
+
+    def fetch(self, url: str) -> bytes:
+        with self._host_slot(url):
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                return self._read_body(response)
+
+    def _read_body(self, response) -> bytes:
+        """
+        Stream the body into one buffer, failing fast on oversized or
+        non-invoice content (HTML error pages, videos, …) instead of
+        buffering it first.
+        """
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise DownloadError(f"File too large ({int(length)} bytes > {self.max_bytes})")
+
+        body = bytearray()
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+            if not body and sniff_format(chunk[:1024]) is None:
+                raise DownloadError("Unsupported content (not an image or PDF)")
+
+            body.extend(chunk)
+            if len(body) > self.max_bytes:
+                raise DownloadError(f"File too large (> {self.max_bytes} bytes)")
+
+        if not body:
+            raise DownloadError("Empty response body")
+        return bytes(body)
+
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+
+def get_downloader() -> Downloader:
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = Downloader()
+        return _downloader
+
+
+def download(url: str) -> bytes:
+    return get_downloader().fetch(url)
+
+
+class Prefetcher:
+    """
+    Downloads a batch's URLs ahead of the OCR threads, in order.
+
+    At most `lookahead` files are downloaded-but-unconsumed at a time,
+    so memory stays bounded on 10k-URL batches. `get(url)` returns the
+    bytes (or raises the download error); URLs not yet scheduled are
+    fetched immediately on the caller's thread.
+    """
+
+    def __init__(self, urls, downloader=None, workers=DOWNLOAD_WORKERS,
+                 lookahead=DOWNLOAD_LOOKAHEAD):
+        self.downloader = downloader or get_downloader()
+        self.lookahead = max(1, lookahead)
+
+        self._pending = deque(urls)
+        self._consumed = set()
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, workers),
+            thread_name_prefix="invoice-download",
+        )
+        self._fill()
+
+    def _fill(self):
+        with self._lock:
+            while self._pending and len(self._futures) < self.lookahead:
+                url = self._pending.popleft()
+                if url in self._consumed or url in self._futures:
+                    continue
+                self._futures[url] = self._executor.submit(self.downloader.fetch, url)
+
+    def get(self, url: str) -> bytes:
+        with self._lock:
+            self._consumed.add(url)
+            future = self._futures.pop(url, None)
+
+        try:
+            if future is None:
+                return self.downloader.fetch(url)
+            return future.result()
+        finally:
+            self._fill()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
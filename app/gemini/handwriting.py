@@ -0,0 +1,112 @@
+# app/gemini/handwriting.py
+# ============================================================
+# TrOCR handwriting stage — LAZY + CPU SAFE
+#   • line crops (from PaddleOCR detection boxes), not whole pages
+#   • batched generate()
+#   • optional int8 dynamically quantized model (TROCR_QUANTIZE=1)
+# ============================================================
+
+import os
+import threading
+
+TROCR_MODEL = os.getenv("TROCR_MODEL", "microsoft/trocr-base-handwritten")
+TROCR_BATCH_SIZE = int(os.getenv("TROCR_BATCH_SIZE", "16"))
+TROCR_MAX_LENGTH = int(os.getenv("TROCR_MAX_LENGTH", "128"))
+TROCR_MAX_LINES = int(os.getenv("TROCR_MAX_LINES", "64"))
+TROCR_QUANTIZE = os.getenv("TROCR_QUANTIZE", "0") == "1"
+
+_trocr_cache = {}
+_trocr_lock = threading.Lock()
+
+
+def load_trocr():
+    with _trocr_lock:
+        if "model" in _trocr_cache:
+            return _trocr_cache["processor"], _trocr_cache["model"]
+
+        try:
+            import torch
+            from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+
+            # ---- HARD CPU SAFETY ----
+            torch.set_num_threads(1)
+            torch.set_num_interop_threads(1)
+
+            print(f"✍️ Initializing TrOCR (handwriting fallback, int8={TROCR_QUANTIZE})")
+
+            processor = TrOCRProcessor.from_pretrained(TROCR_MODEL)
+            model = VisionEncoderDecoderModel.from_pretrained(TROCR_MODEL)
+
+            model.to("cpu")
+            model.eval()
+
+            if TROCR_QUANTIZE:
+                # Linear layers dominate both ViT encoder and text decoder
+                model = torch.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8
+                )
+
+            _trocr_cache["processor"] = processor
+            _trocr_cache["model"] = model
+            return processor, model
+
+        except Exception as e:
+            print("⚠️ TrOCR unavailable:", e)
+            return None, None
+
+
+def _sequence_confidences(model, generated, pad_token_id) -> list:
+    """Mean per-token probability of each generated line."""
+    import torch
+
+    try:
+        scores = model.compute_transition_scores(
+            generated.sequences, generated.scores, normalize_logits=True
+        )
+        mask = generated.sequences[:, 1:] != pad_token_id
+        mean_log_prob = (scores * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return torch.exp(mean_log_prob).tolist()
+    except Exception:
+        return [0.0] * generated.sequences.shape[0]
+
+
+def trocr_recognize_lines(images: list) -> list:
+    """
+    Recognise handwritten line images in batches of TROCR_BATCH_SIZE
+    → [(text, confidence), ...] in input order ([] if TrOCR is missing).
+    """
+    processor, model = load_trocr()
+    if not processor or not model or not images:
+        return []
+
+    try:
+        import torch
+
+        results = []
+        for start in range(0, len(images), TROCR_BATCH_SIZE):
+            batch = images[start:start + TROCR_BATCH_SIZE]
+            pixel_values = processor(images=batch, return_tensors="pt").pixel_values
+
+            with torch.no_grad():
+                generated = model.generate(
+                    pixel_values,
+                    max_length=TROCR_MAX_LENGTH,
+                    return_dict_in_generate=True,
+                    output_scores=True,
+                )
+
+            texts = processor.batch_decode(generated.sequences, skip_special_tokens=True)
+            confs = _sequence_confidences(model, generated, processor.tokenizer.pad_token_id)
+            results.extend((text.strip(), float(conf)) for text, conf in zip(texts, confs))
+
+        return results
+
+    except Exception as e:
+        print("⚠️ TrOCR failed:", e)
+        return []
+
+
+def trocr_handwritten_text(img) -> str:
+    """Single-image helper (whole page or one line)."""
+    lines = trocr_recognize_lines([img])
+    return lines[0][0] if lines else ""
@@ -0,0 +1,94 @@
+# app/gemini/image_prep.py
+# ============================================================
+# Copy-free image decode + preprocessing for OCR
+# ============================================================
+#
+#   bytes ──cv2.imdecode(GRAYSCALE, DCT-reduced)──► gray (≈ target size)
+#         ──cv2.resize(INTER_AREA, 1 channel)────► gray (≤ OCR_MAX_DIM)
+#         ──GRAY2RGB (once, at target size)──────► model input
+#
+# The old path decoded a full-resolution RGB frame with PIL, copied it
+# into NumPy, resized 3 channels, then went RGB→GRAY→RGB. Here the
+# decoder emits grayscale straight from the byte buffer (no RGB frame
+# ever exists) and the only 3-channel buffer is the final one PaddleOCR
+# needs.
+#
+# Kept free of PaddleOCR imports so benchmarks can use it directly.
+
+import os
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Bump whenever preprocess() output changes – invalidates the OCR cache
+PREPROCESS_VERSION = 2
+
+OCR_MAX_DIM = 2000
+DECODE_MAX_PIXELS = int(os.getenv("DECODE_MAX_PIXELS", str(120_000_000)))
+
+_REDUCED_GRAYSCALE = (
+    (8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+def _jpeg_decode_flag(width: int, height: int, max_dim: int) -> int:
+    """Largest DCT reduction that still leaves the long side >= max_dim."""
+    for factor, flag in _REDUCED_GRAYSCALE:
+        if max(width, height) // factor >= max_dim:
+            return flag
+    return cv2.IMREAD_GRAYSCALE
+
+
+def decode_image(data: bytes, max_dim: int = OCR_MAX_DIM) -> np.ndarray:
+    """
+    Decode invoice bytes to a single-channel uint8 array with bounded
+    memory. JPEGs are DCT-scaled by libjpeg (1/2, 1/4, 1/8) straight to
+    the smallest size that is still >= max_dim.
+    """
+    header = Image.open(BytesIO(data))  # reads the header only
+    width, height = header.size
+
+    if header.format == "JPEG":
+        flag = _jpeg_decode_flag(width, height, max_dim)
+    elif width * height > DECODE_MAX_PIXELS:
+        raise ValueError(f"Image too large to decode ({width}x{height})")
+    else:
+        flag = cv2.IMREAD_GRAYSCALE
+
+    gray = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+
+    # Formats OpenCV cannot read (GIF, some TIFFs) go through PIL
+    if gray is None:
+        gray = np.asarray(header.convert("L"))
+    return gray
+
+
+def image_size(data: bytes) -> tuple:
+    """(width, height) of the stored image, read from the header only."""
+    return Image.open(BytesIO(data)).size
+
+
+def to_gray(img: np.ndarray, max_dim: int = OCR_MAX_DIM) -> np.ndarray:
+    """Single-channel copy of gray (H, W) or RGB (H, W, 3) input, long side <= max_dim."""
+    if img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+
+    h, w = img.shape[:2]
+    if max(h, w) > max_dim:
+        scale = max_dim / max(h, w)
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def preprocess(img: np.ndarray, max_dim: int = OCR_MAX_DIM) -> np.ndarray:
+    """
+    Gray → downscale → 3-channel model input, in that order, so the
+    resize touches one channel and the colour expansion happens once at
+    the final size. Accepts gray (H, W) or RGB (H, W, 3) input.
+    """
+    # PaddleOCR's normaliser needs H×W×3
+    return cv2.cvtColor(to_gray(img, max_dim), cv2.COLOR_GRAY2RGB)
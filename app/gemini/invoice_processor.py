@@ -1,18 +1,26 @@
 # app/gemini/invoice_processor.py
 
+import os
 import sys
-import json
 import hashlib
 from decimal import Decimal
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.db.models import F
 from django.utils import timezone
 from django.utils.dateparse import parse_date
-from django.db import transaction, IntegrityError
-from app.models import ExtractionBatch, InvoiceExtraction, CustomExtractionField
-from app.gemini.ocr_engine import extract_text_from_url
-from app.gemini.builder import build_invoice_prompt
+from django.db import transaction, IntegrityError, close_old_connections
+from app.models import ExtractionBatch, InvoiceExtraction
+from app.gemini.ocr_engine import extract_document_from_bytes, OCR_POOL_SIZE
+from app.gemini.downloader import Prefetcher, download
+from app.gemini.near_duplicates import OCR_DEDUP_ENABLED, get_duplicate_index, image_fingerprint
+from app.gemini.ocr_layout import encode_layout
+from app.gemini.blob_codec import compress_text, decompress_text
+from app.gemini.builder import GEMINI_STRUCTURED_OUTPUT, build_invoice_prompt, get_extraction_schema
+from app.gemini.lenient_json import TruncatedJSON
 from app.gemini.client import client
+from app.gemini.packing import GEMINI_PACK_MAX_DOCS, chain, get_packer, resolved, then
+from app.gemini.llm_cache import get_llm_cache, llm_cache_key
+from app.gemini.llm_dispatcher import LLM_DISPATCHER, LLM_MAX_CONCURRENCY, get_llm_dispatcher
 import re
 from collections import Counter
 from app.gemini.script_registry import detect_scripts
@@ -20,6 +28,13 @@ from app.gemini.script_registry import detect_scripts
 
 MAX_WORKERS = 10  
 
+# Invoice threads only download and OCR. Gemini → validate → store runs
+# as a continuation on _finish_threads once the LLM call resolves, so
+# no thread is parked on Gemini and how many calls are in flight is up
+# to llm_dispatcher (AIMD, rate limits) alone.
+INVOICE_THREADS = MAX_WORKERS
+_finish_threads = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="invoice-finish")
+
 
 # ============ DATA NORMALIZATION ============
 
@@ -47,20 +62,30 @@ def normalize_core_invoice_fields(data: dict) -> dict:
 
 # ============ INVOICE STORAGE ============
 
+def refresh_extraction_schema():
+    """Recompile the field schema once per batch (fields may have changed in another process)."""
+    try:
+        get_extraction_schema(refresh=True)
+    except ValueError as e:
+        print(f"⚠️ {e}")
+
+
 def _fingerprint(no, gstin, dt, amt):
     return hashlib.sha256(f"{no}|{gstin}|{dt}|{amt}".encode()).hexdigest()
 
-def store_invoice_extraction(*, batch_master, url, extracted_data, user_id):
-    """Store extracted invoice data with duplicate detection."""
-    allowed_keys = set(CustomExtractionField.objects.filter(is_required=True).values_list("name", flat=True))
-    filtered_data = {k: v for k, v in extracted_data.items() if k in allowed_keys}
+def store_invoice_extraction(*, batch_master, url, extracted_data, user_id, ocr_metrics=None, fingerprint=None,
+                             ocr_layout=None, ocr_text=None):
+    """Store extracted invoice data with duplicate detection. Returns the row id."""
+    filtered_data = get_extraction_schema().clean(extracted_data)
 
     core = normalize_core_invoice_fields(extracted_data)
     f_print = _fingerprint(core["invoice_no"], core["gstin"], core["invoice_date"], core["invoice_amount"])
 
+    phash_value, signature = fingerprint or (None, None)
+
     try:
         with transaction.atomic():
-            InvoiceExtraction.objects.create(
+            extraction = InvoiceExtraction.objects.create(
                 batch_master=batch_master,
                 source_file_name=batch_master.file_name,
                 source_file_url=url,
@@ -70,11 +95,91 @@ def store_invoice_extraction(*, batch_master, url, extracted_data, user_id):
                 invoice_amount=core["invoice_amount"],
                 duplicate_fingerprint=f_print,
                 extracted_data=filtered_data,
+                ocr_metrics=ocr_metrics or {},
+                ocr_layout=ocr_layout,
+                ocr_text=ocr_text,
+                image_phash=f"{phash_value:016x}" if phash_value is not None else None,
+                image_signature=signature,
                 status="SUCCESS",
                 created_by_id=user_id
             )
+            return extraction.id
     except IntegrityError:
         InvoiceExtraction.objects.filter(duplicate_fingerprint=f_print).update(status="DUPLICATE")
+        return InvoiceExtraction.objects.filter(duplicate_fingerprint=f_print).values_list("id", flat=True).first()
+
+
+def store_near_duplicate(*, batch_master_id, url, match, user_id):
+    """Link a near-duplicate image to the original's extraction (no OCR / LLM)."""
+    original = InvoiceExtraction.objects.get(id=match["entry"].extraction_id)
+    batch_master = ExtractionBatch.objects.get(id=batch_master_id)
+    InvoiceExtraction.objects.create(
+        batch_master=batch_master,
+        source_file_name=batch_master.file_name,
+        source_file_url=url,
+        invoice_no=original.invoice_no,
+        invoice_supplier_gstin_number=original.invoice_supplier_gstin_number,
+        invoice_date=original.invoice_date,
+        invoice_amount=original.invoice_amount,
+        duplicate_fingerprint=hashlib.sha256(f"{url}_{timezone.now().isoformat()}".encode()).hexdigest(),
+        extracted_data=original.extracted_data,
+        ocr_metrics={
+            "ocr_path": "near_duplicate",
+            "duplicate_of": original.id,
+            "phash_distance": match["phash_distance"],
+            "local_diff": match["local_diff"],
+        },
+        duplicate_of=original,
+        status="DUPLICATE",
+        created_by_id=user_id
+    )
+    return original.id
+
+
+def update_invoice_extraction(extraction_id, extracted_data):
+    """Overwrite an existing row with re-extracted data (re-extract mode)."""
+    filtered_data = get_extraction_schema().clean(extracted_data)
+
+    core = normalize_core_invoice_fields(extracted_data)
+    f_print = _fingerprint(core["invoice_no"], core["gstin"], core["invoice_date"], core["invoice_amount"])
+    fields = dict(
+        invoice_no=core["invoice_no"],
+        invoice_supplier_gstin_number=core["gstin"],
+        invoice_date=core["invoice_date"],
+        invoice_amount=core["invoice_amount"],
+        extracted_data=filtered_data,
+    )
+
+    try:
+        with transaction.atomic():
+            InvoiceExtraction.objects.filter(id=extraction_id).update(
+                duplicate_fingerprint=f_print, status="SUCCESS", **fields
+            )
+    except IntegrityError:
+        # Another row already holds this invoice
+        InvoiceExtraction.objects.filter(id=extraction_id).update(status="DUPLICATE", **fields)
+
+
+def store_failed_extraction(*, batch_master_id, url, extracted_data, user_id, ocr_metrics=None, ocr_layout=None,
+                            ocr_text=None):
+    """Store a FAILED row (unique fingerprint per attempt)."""
+    batch_master = ExtractionBatch.objects.get(id=batch_master_id)
+    InvoiceExtraction.objects.create(
+        batch_master=batch_master,
+        source_file_name=batch_master.file_name,
+        source_file_url=url,
+        invoice_no=None,
+        invoice_supplier_gstin_number=None,
+        invoice_date=None,
+        invoice_amount=None,
+        duplicate_fingerprint=hashlib.sha256(f"{url}_{timezone.now().isoformat()}".encode()).hexdigest(),
+        extracted_data=extracted_data,
+        ocr_metrics=ocr_metrics or {},
+        ocr_layout=ocr_layout,
+        ocr_text=ocr_text,
+        status="FAILED",
+        created_by_id=user_id
+    )
 
 
 # ============ OCR & GEMINI VALIDATION ============
@@ -150,47 +255,228 @@ def validate_gemini_response(data):
     return True
 
 
-def process_single_invoice(url, batch_master_id, user_id, index, total):
+GEMINI_EXTRACTION_MODEL = "gemini-2.5-flash"
+
+
+def structured_config(response_schema):
+    """generate_content config for typed JSON output (None in free-text mode)."""
+    if not GEMINI_STRUCTURED_OUTPUT:
+        return None
+    return {"response_mime_type": "application/json", "response_schema": response_schema}
+
+
+def generate_gemini_text(prompt, config=None):
+    if LLM_DISPATCHER:
+        return get_llm_dispatcher(GEMINI_EXTRACTION_MODEL).generate(prompt, config)
+    
+    response = client.models.generate_content(
+        model=GEMINI_EXTRACTION_MODEL,
+        contents=[prompt],
+        config=config
+    )
+    return response.text or ""
+
+
+# Only used with LLM_DISPATCHER=0 – the dispatcher has its own loop
+_gemini_threads = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY)
+
+
+def submit_gemini_text(prompt, config=None):
+    """Future of the response text, without holding the caller's thread."""
+    if LLM_DISPATCHER:
+        return get_llm_dispatcher(GEMINI_EXTRACTION_MODEL).submit(prompt, config)
+    return _gemini_threads.submit(generate_gemini_text, prompt, config)
+
+
+def submit_packed_gemini_text(prompt, schema):
+    return submit_gemini_text(prompt, structured_config(schema.packed_response_schema))
+
+
+# Re-asks when an answer was cut off before every required field was read
+GEMINI_TRUNCATED_RETRIES = int(os.getenv("GEMINI_TRUNCATED_RETRIES", "1"))
+
+
+def submit_single_invoice_fields(raw_text, schema=None, retries=GEMINI_TRUNCATED_RETRIES):
+    """
+    One OCR text → prompt → Gemini → Future of the typed field dict
+    (cleaned, not yet validated). `schema` defaults to the current one.
+    """
+    schema = schema or get_extraction_schema()
+    output = submit_gemini_text(
+        build_invoice_prompt(raw_text, schema=schema), structured_config(schema.response_schema)
+    )
+    
+    def parse(text):
+        try:
+            extracted_data = schema.parse(text)
+        except TruncatedJSON:
+            if retries <= 0:
+                raise
+            print("✂️ Gemini answer cut off before all fields – asking again")
+            sys.stdout.flush()
+            return submit_single_invoice_fields(raw_text, schema, retries - 1)
+        print(f"🔍 Gemini extracted data: {extracted_data}")
+        sys.stdout.flush()
+        return extracted_data
+    
+    return chain(output, parse)
+
+
+def submit_fields_with_gemini(raw_text):
+    """
+    OCR text → Future of (Gemini fields, cache key, cache hit).
+    
+    The LLM response cache (llm_cache.py) is checked first, on the
+    calling thread. On a miss, with GEMINI_PACK_MAX_DOCS > 1, texts from
+    concurrent invoices share packed requests (see packing.py). Callers
+    validate the fields and hand fresh, valid ones to
+    remember_gemini_fields.
+    """
+    cache = get_llm_cache()
+    cache_key = None
+    
+    if cache is not None:
+        try:
+            cache_key = llm_cache_key(
+                raw_text, get_extraction_schema().prompt_hash(GEMINI_STRUCTURED_OUTPUT), GEMINI_EXTRACTION_MODEL
+            )
+            cached = cache.get(cache_key)
+        except Exception as e:
+            print("⚠️ LLM cache lookup failed:", e)
+            cache_key, cached = None, None
+        if cached is not None:
+            print("💾 LLM cache hit – skipping Gemini")
+            sys.stdout.flush()
+            return resolved((cached, cache_key, True))
+    
+    if GEMINI_PACK_MAX_DOCS <= 1:
+        request = submit_single_invoice_fields(raw_text)
+    else:
+        packer = get_packer(submit_packed_gemini_text, submit_single_invoice_fields, validate_gemini_response)
+        request = packer.submit(raw_text, get_extraction_schema())
+    return chain(request, lambda fields: (fields, cache_key, False))
+
+
+def remember_gemini_fields(cache_key, extracted_data):
+    cache = get_llm_cache()
+    if cache is None or cache_key is None:
+        return
+    try:
+        cache.put(
+            cache_key, extracted_data, GEMINI_EXTRACTION_MODEL,
+            get_extraction_schema().prompt_hash(GEMINI_STRUCTURED_OUTPUT)
+        )
+    except Exception as e:
+        print("⚠️ LLM cache store failed:", e)
+
+
+def process_single_invoice(url, batch_master_id, user_id, index, total, fetch=None):
+    """
+    Download → near-duplicate check → OCR → OCR validation on the calling
+    thread; Gemini → validation → storage runs as a continuation once the
+    LLM call resolves, so the thread moves on to the next invoice.
+    Returns a Future of the result dict.
+    """
     result = {
         'url': url,
         'index': index,
         'status': 'failed',
         'error': None
     }
+    ocr_metrics = {}
+    ocr_layout = None
+    ocr_text = None
+    fingerprint = None
+    dup_entry = None
+    
+    def failed(e):
+        print(f"❌ Invoice failed: {e}")
+        result['error'] = str(e)
+        
+        if "Invalid OCR quality" not in str(e) and "Empty template" not in str(e):
+            try:
+                if not InvoiceExtraction.objects.filter(source_file_url=url, batch_master_id=batch_master_id).exists():
+                    store_failed_extraction(
+                        batch_master_id=batch_master_id,
+                        url=url,
+                        extracted_data={"error": str(e)},
+                        user_id=user_id,
+                        ocr_metrics=ocr_metrics,
+                        ocr_layout=ocr_layout,
+                        ocr_text=ocr_text
+                    )
+            except Exception as store_error:
+                print(f"⚠️ Could not store failed record: {store_error}")
+    
+    def done(extraction_id=None):
+        if dup_entry is not None:
+            get_duplicate_index().resolve(dup_entry, extraction_id)
+        
+        try:
+            with transaction.atomic():
+                ExtractionBatch.objects.filter(id=batch_master_id).update(
+                    processed_count=F("processed_count") + 1
+                )
+        except Exception as e:
+            print(f"⚠️ Progress update failed: {e}")
+        return result
     
     try:
         print(f"📝 Processing {index}/{total}: {url}")
         sys.stdout.flush()
         
+        data = (fetch or download)(url)
+        
+        # Near-duplicate of an invoice already extracted (this or an earlier batch)?
+        fingerprint = image_fingerprint(data) if OCR_DEDUP_ENABLED else None
+        if fingerprint:
+            dup_entry, match = get_duplicate_index().claim_or_wait(fingerprint)
+            if match:
+                original_id = store_near_duplicate(
+                    batch_master_id=batch_master_id,
+                    url=url,
+                    match=match,
+                    user_id=user_id
+                )
+                print(f"🧬 Near-duplicate of extraction {original_id} – skipped OCR and Gemini")
+                result['status'] = 'duplicate'
+                return resolved(done())
+        
         # OCR Extraction
-        raw_text = extract_text_from_url(url)
+        document = extract_document_from_bytes(data)
+        raw_text = document.text
+        ocr_metrics = document.metrics
+        ocr_layout = encode_layout(document.pages) if document.pages else None
+        ocr_text = compress_text(raw_text) if raw_text else None
         
+        print(f"📄 OCR path: {ocr_metrics.get('ocr_path')}")
         print("========== OCR OUTPUT ==========")
         print(raw_text[:500])
         print("================================")
         sys.stdout.flush()
         
-        # Validate OCR quality
-        is_valid, validation_reason = validate_ocr_quality(raw_text)
+        # Validate OCR quality (images the pre-OCR gate rejected were never OCR'd)
+        gate = ocr_metrics.get("quality_gate", {})
+        if gate.get("passed") is False:
+            is_valid, validation_reason = False, f"Image rejected before OCR: {gate.get('reason')}"
+        elif not raw_text and ocr_metrics.get("text_gate_rejected_pages"):
+            is_valid, validation_reason = False, "Too little text detected (recognition skipped)"
+        else:
+            is_valid, validation_reason = validate_ocr_quality(raw_text)
         
         if not is_valid:
             print(f"⚠️ SKIPPING: {validation_reason}")
             print(f"💰 Saved API tokens by not sending to Gemini")
             sys.stdout.flush()
             
-            batch_master = ExtractionBatch.objects.get(id=batch_master_id)
-            InvoiceExtraction.objects.create(
-                batch_master=batch_master,
-                source_file_name=batch_master.file_name,
-                source_file_url=url,
-                invoice_no=None,
-                invoice_supplier_gstin_number=None,
-                invoice_date=None,
-                invoice_amount=None,
-                duplicate_fingerprint=hashlib.sha256(f"{url}_{timezone.now().isoformat()}".encode()).hexdigest(),
+            store_failed_extraction(
+                batch_master_id=batch_master_id,
+                url=url,
                 extracted_data={"error": validation_reason},
-                status="FAILED",
-                created_by_id=user_id
+                user_id=user_id,
+                ocr_metrics=ocr_metrics,
+                ocr_layout=ocr_layout,
+                ocr_text=ocr_text
             )
             
             raise ValueError(f"Invalid OCR quality: {validation_reason}")
@@ -202,95 +488,65 @@ def process_single_invoice(url, batch_master_id, user_id, index, total):
         print("🧠 Sending text to Gemini")
         sys.stdout.flush()
         
-        prompt = build_invoice_prompt(raw_text)
-        
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[prompt]
-        )
-        
-        output = response.text or ""
-        if "{" not in output:
-            raise ValueError("Gemini did not return JSON")
-        
-        json_str = output[output.find("{"):output.rfind("}") + 1]
-        extracted_data = json.loads(json_str)
-        
-        print(f"🔍 Gemini extracted data: {extracted_data}")
-        sys.stdout.flush()
-        
-        # Validate Gemini response
-        if not validate_gemini_response(extracted_data):
-            print("⚠️ REJECTING: Gemini returned only default values (empty template detected)")
-            print(f"💰 Prevented storing invalid invoice data")
+        request = submit_fields_with_gemini(raw_text)
+    
+    except Exception as e:
+        failed(e)
+        return resolved(done())
+    
+    def finish(request):
+        close_old_connections()
+        extraction_id = None
+        try:
+            extracted_data, cache_key, cache_hit = request.result()
+            ocr_metrics["llm_cache"] = "hit" if cache_hit else "miss"
+            
+            # Validate Gemini response
+            if not validate_gemini_response(extracted_data):
+                print("⚠️ REJECTING: Gemini returned only default values (empty template detected)")
+                print(f"💰 Prevented storing invalid invoice data")
+                sys.stdout.flush()
+                
+                store_failed_extraction(
+                    batch_master_id=batch_master_id,
+                    url=url,
+                    extracted_data={"error": "Empty template - Gemini returned only default values", "raw_response": extracted_data},
+                    user_id=user_id,
+                    ocr_metrics=ocr_metrics,
+                    ocr_layout=ocr_layout,
+                    ocr_text=ocr_text
+                )
+                
+                raise ValueError("Empty template detected: Gemini returned only default values")
+            
+            print(f"✅ Gemini validation passed: Contains valid invoice data")
             sys.stdout.flush()
             
+            if not cache_hit:
+                remember_gemini_fields(cache_key, extracted_data)
+            
+            # Store in database
             batch_master = ExtractionBatch.objects.get(id=batch_master_id)
-            InvoiceExtraction.objects.create(
+            extraction_id = store_invoice_extraction(
                 batch_master=batch_master,
-                source_file_name=batch_master.file_name,
-                source_file_url=url,
-                invoice_no=None,
-                invoice_supplier_gstin_number=None,
-                invoice_date=None,
-                invoice_amount=None,
-                duplicate_fingerprint=hashlib.sha256(f"{url}_{timezone.now().isoformat()}".encode()).hexdigest(),
-                extracted_data={"error": "Empty template - Gemini returned only default values", "raw_response": extracted_data},
-                status="FAILED",
-                created_by_id=user_id
+                url=url,
+                extracted_data=extracted_data,
+                user_id=user_id,
+                ocr_metrics=ocr_metrics,
+                fingerprint=fingerprint,
+                ocr_layout=ocr_layout,
+                ocr_text=ocr_text
             )
             
-            raise ValueError("Empty template detected: Gemini returned only default values")
-        
-        print(f"✅ Gemini validation passed: Contains valid invoice data")
-        sys.stdout.flush()
-        
-        # Store in database
-        batch_master = ExtractionBatch.objects.get(id=batch_master_id)
-        store_invoice_extraction(
-            batch_master=batch_master,
-            url=url,
-            extracted_data=extracted_data,
-            user_id=user_id
-        )
+            print("✅ Invoice extracted")
+            result['status'] = 'success'
         
-        print("✅ Invoice extracted")
-        result['status'] = 'success'
-        
-    except Exception as e:
-        print(f"❌ Invoice failed: {e}")
-        result['error'] = str(e)
-        
-        if "Invalid OCR quality" not in str(e) and "Empty template" not in str(e):
-            try:
-                batch_master = ExtractionBatch.objects.get(id=batch_master_id)
-                if not InvoiceExtraction.objects.filter(source_file_url=url, batch_master=batch_master).exists():
-                    InvoiceExtraction.objects.create(
-                        batch_master=batch_master,
-                        source_file_name=batch_master.file_name,
-                        source_file_url=url,
-                        invoice_no=None,
-                        invoice_supplier_gstin_number=None,
-                        invoice_date=None,
-                        invoice_amount=None,
-                        duplicate_fingerprint=hashlib.sha256(f"{url}_{timezone.now().isoformat()}".encode()).hexdigest(),
-                        extracted_data={"error": str(e)},
-                        status="FAILED",
-                        created_by_id=user_id
-                    )
-            except Exception as store_error:
-                print(f"⚠️ Could not store failed record: {store_error}")
-    
-    finally:
-        try:
-            with transaction.atomic():
-                ExtractionBatch.objects.filter(id=batch_master_id).update(
-                    processed_count=F("processed_count") + 1
-                )
         except Exception as e:
-            print(f"⚠️ Progress update failed: {e}")
+            failed(e)
+        
+        return done(extraction_id)
     
-    return result
+    return then(request, finish, _finish_threads)
 
 
 def process_invoices_parallel(batch_master_id, urls, user_id):
@@ -301,39 +557,47 @@ def process_invoices_parallel(batch_master_id, urls, user_id):
     
     batch_master = ExtractionBatch.objects.get(id=batch_master_id)
     total_urls = len(urls)
+    refresh_extraction_schema()
     
     print(f"🚀 Started Batch {batch_master_id} with {total_urls} invoices")
-    print(f"⚙️ Using {MAX_WORKERS} parallel workers")
+    print(f"⚙️ Using {MAX_WORKERS} parallel OCR workers ({OCR_POOL_SIZE} shared OCR engines), {INVOICE_THREADS} invoice threads")
     sys.stdout.flush()
     
     try:
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_url = {
+        with Prefetcher(urls) as prefetcher, ThreadPoolExecutor(max_workers=INVOICE_THREADS) as executor:
+            started = {
                 executor.submit(
                     process_single_invoice,
                     url,
                     batch_master_id,
                     user_id,
                     index,
-                    total_urls
+                    total_urls,
+                    prefetcher.get
                 ): url
                 for index, url in enumerate(urls, start=1)
             }
-            
-            success_count = 0
-            failed_count = 0
-            
-            for future in as_completed(future_to_url):
-                url = future_to_url[future]
-                try:
-                    result = future.result()
-                    if result['status'] == 'success':
-                        success_count += 1
-                    else:
-                        failed_count += 1
-                except Exception as e:
-                    print(f"❌ Future exception for {url}: {e}")
+        
+        # Every invoice is OCR'd; wait for the Gemini / storage continuations
+        future_to_url = {future.result(): url for future, url in started.items()}
+        
+        success_count = 0
+        failed_count = 0
+        duplicate_count = 0
+        
+        for future in as_completed(future_to_url):
+            url = future_to_url[future]
+            try:
+                result = future.result()
+                if result['status'] == 'success':
+                    success_count += 1
+                elif result['status'] == 'duplicate':
+                    duplicate_count += 1
+                else:
                     failed_count += 1
+            except Exception as e:
+                print(f"❌ Future exception for {url}: {e}")
+                failed_count += 1
         
         batch_master.refresh_from_db()
         batch_master.status = "COMPLETED"
@@ -341,7 +605,11 @@ def process_invoices_parallel(batch_master_id, urls, user_id):
         batch_master.save(update_fields=["status", "completed_at"])
         
         print(f"🏁 Batch Fully Completed")
-        print(f"✅ Success: {success_count} | ❌ Failed: {failed_count} | 📊 Total: {total_urls}")
+        print(f"✅ Success: {success_count} | 🧬 Near-duplicates: {duplicate_count} | ❌ Failed: {failed_count} | 📊 Total: {total_urls}")
+        if get_llm_cache() is not None:
+            print(f"💾 LLM cache: {get_llm_cache().stats()}")
+        if LLM_DISPATCHER:
+            print(f"🚦 LLM dispatcher: {get_llm_dispatcher(GEMINI_EXTRACTION_MODEL).snapshot()}")
         sys.stdout.flush()
     
     except Exception as e:
@@ -358,3 +626,145 @@ def process_invoices_parallel(batch_master_id, urls, user_id):
     
     finally:
         connection.close()
+
+
+# ============ RE-EXTRACT MODE (saved OCR text → Gemini only) ============
+
+def reextract_single_invoice(extraction_id, batch_master_id, index, total):
+    """
+    Saved OCR text → Gemini → update; like process_single_invoice, the
+    Gemini stage is a continuation. Returns a Future of the result dict.
+    """
+    result = {'id': extraction_id, 'index': index, 'status': 'failed', 'error': None}
+    
+    def failed(e):
+        print(f"❌ Re-extraction failed for invoice {extraction_id}: {e}")
+        result['error'] = str(e)
+    
+    def done():
+        try:
+            ExtractionBatch.objects.filter(id=batch_master_id).update(
+                reextract_processed_count=F("reextract_processed_count") + 1
+            )
+        except Exception as e:
+            print(f"⚠️ Re-extract progress update failed: {e}")
+        return result
+    
+    try:
+        raw_text = decompress_text(
+            InvoiceExtraction.objects.filter(id=extraction_id).values_list("ocr_text", flat=True).first()
+        )
+        print(f"♻️ Re-extracting {index}/{total}: invoice {extraction_id}")
+        sys.stdout.flush()
+        
+        is_valid, validation_reason = validate_ocr_quality(raw_text)
+        if not is_valid:
+            InvoiceExtraction.objects.filter(id=extraction_id).update(
+                status="FAILED", extracted_data={"error": validation_reason}
+            )
+            raise ValueError(f"Invalid OCR quality: {validation_reason}")
+        
+        request = submit_fields_with_gemini(raw_text)
+    
+    except Exception as e:
+        failed(e)
+        return resolved(done())
+    
+    def finish(request):
+        close_old_connections()
+        try:
+            extracted_data, cache_key, cache_hit = request.result()
+            
+            if not validate_gemini_response(extracted_data):
+                InvoiceExtraction.objects.filter(id=extraction_id).update(
+                    status="FAILED",
+                    extracted_data={"error": "Empty template - Gemini returned only default values", "raw_response": extracted_data}
+                )
+                raise ValueError("Empty template detected: Gemini returned only default values")
+            
+            if not cache_hit:
+                remember_gemini_fields(cache_key, extracted_data)
+            update_invoice_extraction(extraction_id, extracted_data)
+            result['status'] = 'success'
+        
+        except Exception as e:
+            failed(e)
+        
+        return done()
+    
+    return then(request, finish, _finish_threads)
+
+
+def refresh_near_duplicates(batch_master_id):
+    """Near-duplicate rows have no OCR text of their own – copy from the original again."""
+    duplicates = InvoiceExtraction.objects.filter(
+        batch_master_id=batch_master_id, duplicate_of__isnull=False
+    ).select_related("duplicate_of")
+    
+    for dup in duplicates:
+        original = dup.duplicate_of
+        InvoiceExtraction.objects.filter(id=dup.id).update(
+            invoice_no=original.invoice_no,
+            invoice_supplier_gstin_number=original.invoice_supplier_gstin_number,
+            invoice_date=original.invoice_date,
+            invoice_amount=original.invoice_amount,
+            extracted_data=original.extracted_data,
+        )
+
+
+def reextract_invoices_parallel(batch_master_id):
+    """
+    Re-run prompt → Gemini → store for every invoice of a batch from its
+    saved OCR text (no download, no OCR). Progress is tracked in the
+    batch's reextract_* fields, separately from the original run.
+    """
+    from django.db import connection
+    
+    batch_master = ExtractionBatch.objects.get(id=batch_master_id)
+    refresh_extraction_schema()
+    extraction_ids = list(
+        batch_master.invoices
+        .filter(ocr_text__isnull=False, duplicate_of__isnull=True)
+        .values_list("id", flat=True)
+    )
+    total = len(extraction_ids)
+    
+    ExtractionBatch.objects.filter(id=batch_master_id).update(
+        reextract_status="PROCESSING",
+        reextract_total_count=total,
+        reextract_processed_count=0,
+        reextract_started_at=timezone.now(),
+        reextract_completed_at=None,
+    )
+    
+    print(f"♻️ Started re-extraction of batch {batch_master_id}: {total} invoices with saved OCR text")
+    sys.stdout.flush()
+    
+    try:
+        success_count = 0
+        with ThreadPoolExecutor(max_workers=INVOICE_THREADS) as executor:
+            started = [
+                executor.submit(reextract_single_invoice, extraction_id, batch_master_id, index, total)
+                for index, extraction_id in enumerate(extraction_ids, start=1)
+            ]
+        for future in as_completed([future.result() for future in started]):
+            if future.result()['status'] == 'success':
+                success_count += 1
+        
+        refresh_near_duplicates(batch_master_id)
+        
+        ExtractionBatch.objects.filter(id=batch_master_id).update(
+            reextract_status="COMPLETED",
+            reextract_completed_at=timezone.now(),
+        )
+        print(f"🏁 Re-extraction completed: ✅ {success_count} | ❌ {total - success_count} | 📊 {total}")
+        sys.stdout.flush()
+    
+    except Exception as e:
+        print(f"🛑 RE-EXTRACTION CRASH: {e}")
+        import traceback
+        traceback.print_exc()
+        ExtractionBatch.objects.filter(id=batch_master_id).update(reextract_status="FAILED")
+    
+    finally:
+        connection.close()
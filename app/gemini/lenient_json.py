@@ -0,0 +1,213 @@
+# app/gemini/lenient_json.py
+# ============================================================
+# Lenient JSON parsing for model output
+# ============================================================
+#
+# Structured output normally returns clean JSON; this is the fallback
+# for free-text answers. loads_lenient() tries strict json first, then
+# an incremental parser that tolerates what models actually produce:
+#
+#   ```json fences, text around the JSON, // and /* */ comments,
+#   trailing commas, single quotes, unquoted keys, None/True/False,
+#   and truncation (output cut off at the token limit)
+#
+# Unquoted values are read up to the next , } ] or newline and only
+# become numbers when the whole token is one:
+#
+#   {name: 123 Main St, total: 5}    → {"name": "123 Main St", "total": 5}
+#   {"d": 2024-01-05, "x": 1}        → {"d": "2024-01-05", "x": 1}
+#   {total: 5 // incl. VAT}          → {"total": 5}
+#   {"note": Total # 5, "x": 1}      → {"note": "Total # 5", "x": 1}
+#
+# A malformed \u escape reads as a plain "u" plus its text. On truncation
+# loads_lenient raises TruncatedJSON; its .partial holds every complete
+# key/value pair read so far, and callers decide whether that is enough
+# (ExtractionSchema.parse accepts it only when every required field was
+# read).
+#
+# Cases are in test_lenient_json.py.
+
+import json
+import re
+
+_LITERALS = {
+    "true": True, "false": False, "null": None,
+    "True": True, "False": False, "None": None,
+}
+_NUMBER = re.compile(r"-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+_BARE_KEY = re.compile(r"[^:{}\[\],\n]+")
+_BARE_VALUE = re.compile(r"[^,{}\[\]\n]+")
+_VALUE_COMMENT = re.compile(r"\s(?://|/\*)")
+_HEX4 = re.compile(r"[0-9a-fA-F]{4}")
+_ESCAPES = {'"': '"', "'": "'", "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class TruncatedJSON(ValueError):
+    """Model output ended inside the JSON; `.partial` is what was read before."""
+
+    def __init__(self, partial):
+        super().__init__("Model output ends inside the JSON (truncated)")
+        self.partial = partial
+
+
+class _Truncated(Exception):
+    """Input ended inside a value."""
+
+
+class _Parser:
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.truncated = False
+
+    def _skip(self):
+        text, n = self.text, len(self.text)
+        while self.pos < n:
+            ch = text[self.pos]
+            if ch in " \t\r\n,":   # commas are separators only – trailing / doubled ones are harmless
+                self.pos += 1
+            elif text.startswith("//", self.pos):
+                end = text.find("\n", self.pos)
+                self.pos = n if end < 0 else end + 1
+            elif text.startswith("/*", self.pos):
+                end = text.find("*/", self.pos + 2)
+                self.pos = n if end < 0 else end + 2
+            else:
+                return
+
+    def _peek(self):
+        self._skip()
+        if self.pos >= len(self.text):
+            raise _Truncated
+        return self.text[self.pos]
+
+    def value(self):
+        ch = self._peek()
+        if ch == "{":
+            return self._object()
+        if ch == "[":
+            return self._array()
+        if ch in "\"'":
+            return self._string()
+
+        match = _BARE_VALUE.match(self.text, self.pos)
+        if not match:
+            raise ValueError(f"Unexpected {ch!r} at {self.pos}")
+        end = match.end()
+        comment = _VALUE_COMMENT.search(self.text, self.pos, end)
+        if comment:
+            end = comment.start()   # left for _skip
+        elif end >= len(self.text):
+            raise _Truncated   # a token cut off mid-way is not trusted
+        word = self.text[self.pos:end].strip()
+        self.pos = end
+
+        if _NUMBER.fullmatch(word):
+            return float(word) if any(c in word for c in ".eE") else int(word)
+        return _LITERALS.get(word, word)
+
+    def _string(self):
+        quote = self.text[self.pos]
+        self.pos += 1
+        out = []
+        while self.pos < len(self.text):
+            ch = self.text[self.pos]
+            if ch == quote:
+                self.pos += 1
+                return "".join(out)
+            if ch == "\\" and self.pos + 1 < len(self.text):
+                nxt = self.text[self.pos + 1]
+                if nxt == "u":
+                    if self.pos + 6 > len(self.text):
+                        raise _Truncated
+                    if _HEX4.fullmatch(self.text, self.pos + 2, self.pos + 6):
+                        out.append(chr(int(self.text[self.pos + 2:self.pos + 6], 16)))
+                        self.pos += 6
+                        continue
+                out.append(_ESCAPES.get(nxt, nxt))
+                self.pos += 2
+                continue
+            out.append(ch)
+            self.pos += 1
+        raise _Truncated
+
+    def _bare_key(self):
+        match = _BARE_KEY.match(self.text, self.pos)
+        if not match:
+            raise ValueError(f"Unexpected {self.text[self.pos]!r} at {self.pos}")
+        self.pos = match.end()
+        if self.pos >= len(self.text):
+            raise _Truncated
+        return match.group().strip()
+
+    def _object(self):
+        self.pos += 1
+        result = {}
+        while True:
+            try:
+                ch = self._peek()
+            except _Truncated:
+                self.truncated = True
+                return result
+            if ch in "}]":
+                self.pos += 1
+                return result
+            try:
+                key = self._string() if ch in "\"'" else self._bare_key()
+                if self._peek() == ":":
+                    self.pos += 1
+                result[str(key)] = self.value()
+            except _Truncated:
+                self.truncated = True
+                return result
+
+    def _array(self):
+        self.pos += 1
+        result = []
+        while True:
+            try:
+                ch = self._peek()
+            except _Truncated:
+                self.truncated = True
+                return result
+            if ch in "]}":
+                self.pos += 1
+                return result
+            try:
+                result.append(self.value())
+            except _Truncated:
+                self.truncated = True
+                return result
+
+
+def _json_start(text):
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    return min(starts) if starts else -1
+
+
+def loads_lenient(text: str):
+    """
+    Parse the first JSON object / array in `text` (see module notes).
+    Raises TruncatedJSON when the output was cut off.
+    """
+    text = (text or "").strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    start = _json_start(text)
+    if start < 0:
+        raise ValueError("No JSON in model output")
+
+    try:
+        return json.JSONDecoder().raw_decode(text, start)[0]
+    except ValueError:
+        pass
+
+    parser = _Parser(text[start:])
+    value = parser.value()
+    if parser.truncated:
+        raise TruncatedJSON(value)
+    return value
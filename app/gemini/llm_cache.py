@@ -0,0 +1,143 @@
+# app/gemini/llm_cache.py
+# ============================================================
+# DB-backed cache of validated Gemini extractions
+# ============================================================
+#
+# Re-running a batch, or the same invoice arriving under another URL,
+# sends identical OCR text to Gemini again. Key:
+#
+#   sha256(normalised OCR text, ExtractionSchema.prompt_hash, model name)
+#
+# The prompt hash covers the compiled prompt around the OCR text (rules,
+# field list, output format) and the structured-output mode, so editing
+# the prompt or the required fields never serves a stale answer.
+#
+# Only responses that passed validate_gemini_response are stored.
+# Rows expire after LLM_CACHE_TTL_DAYS; every LLM_CACHE_EVICT_EVERY
+# writes, expired rows are deleted and the table is trimmed back to 90 %
+# of LLM_CACHE_MAX_ROWS, least recently used first.
+
+import os
+import json
+import hashlib
+import threading
+import unicodedata
+from datetime import timedelta
+
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_DAYS = int(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "50000"))
+LLM_CACHE_EVICT_EVERY = int(os.getenv("LLM_CACHE_EVICT_EVERY", "200"))
+
+
+def normalize_ocr_text(text: str) -> str:
+    """NFKC, collapse whitespace within lines, drop blank lines."""
+    text = unicodedata.normalize("NFKC", text or "")
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def llm_cache_key(ocr_text: str, prompt_hash: str, model: str) -> str:
+    """`prompt_hash` is ExtractionSchema.prompt_hash() for the mode in use."""
+    payload = json.dumps(
+        {
+            "text": normalize_ocr_text(ocr_text),
+            "prompt": prompt_hash,
+            "model": model,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LlmResponseCache:
+
+    def __init__(self, ttl_days=LLM_CACHE_TTL_DAYS, max_rows=LLM_CACHE_MAX_ROWS,
+                 evict_every=LLM_CACHE_EVICT_EVERY):
+        self.ttl = timedelta(days=ttl_days)
+        self.max_rows = max_rows
+        self.evict_every = max(1, evict_every)
+
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "puts": 0, "evicted": 0}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+            return self._stats[name]
+
+    def get(self, key: str):
+        from app.models import LlmResponseCache as Row
+
+        row = Row.objects.filter(cache_key=key).values("id", "response", "created_at").first()
+        if row is None or row["created_at"] < timezone.now() - self.ttl:
+            self._count("misses")
+            return None
+
+        Row.objects.filter(id=row["id"]).update(hit_count=F("hit_count") + 1, last_used_at=timezone.now())
+        self._count("hits")
+        return row["response"]
+
+    def put(self, key: str, response: dict, model: str, prompt_hash: str = ""):
+        from app.models import LlmResponseCache as Row
+
+        try:
+            Row.objects.update_or_create(
+                cache_key=key,
+                defaults={
+                    "model_name": model,
+                    "prompt_hash": prompt_hash,
+                    "response": response,
+                    "created_at": timezone.now(),
+                    "last_used_at": timezone.now(),
+                },
+            )
+        except IntegrityError:
+            return   # a concurrent writer stored the same key
+
+        if self._count("puts") % self.evict_every == 0:
+            self.evict()
+
+    def evict(self) -> int:
+        from app.models import LlmResponseCache as Row
+
+        deleted, _ = Row.objects.filter(created_at__lt=timezone.now() - self.ttl).delete()
+
+        excess = Row.objects.count() - self.max_rows
+        if excess > 0:
+            excess += self.max_rows // 10
+            stale = list(Row.objects.order_by("last_used_at").values_list("id", flat=True)[:excess])
+            trimmed, _ = Row.objects.filter(id__in=stale).delete()
+            deleted += trimmed
+
+        if deleted:
+            self._count("evicted", deleted)
+            print(f"🧹 LLM cache evicted {deleted} rows")
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Process-wide cache, or None when LLM_CACHE_ENABLED=0."""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LlmResponseCache()
+        return _cache
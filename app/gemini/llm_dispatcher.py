@@ -0,0 +1,319 @@
+# app/gemini/llm_dispatcher.py
+# ============================================================
+# Async Gemini dispatcher: rate limits, AIMD concurrency, retries
+# ============================================================
+#
+# All Gemini calls go through one asyncio loop on a background thread.
+# Invoice threads call generate(prompt) and block on a Future, so how
+# many calls are in flight is decided here, not by the OCR thread count.
+#
+#   RPM / TPM    token buckets (LLM_RPM, LLM_TPM); TPM is charged an
+#                estimate up front, corrected from usage_metadata on
+#                success and refunded on failure
+#   concurrency  AIMD: +1/limit per fast success, ×LLM_AIMD_DECREASE on
+#                429 / 5xx / timeout or latency above 2× target (at most
+#                once per LLM_AIMD_COOLDOWN_S), no growth while the
+#                error rate is high
+#   retries      429 / 5xx / timeouts / connection errors (incl. httpx
+#                ConnectError, ReadTimeout, RemoteProtocolError),
+#                full-jitter exponential backoff
+#
+# LLM_BACKEND=fake swaps Gemini for FakeGeminiBackend, a local endpoint
+# with its own quota, load-dependent latency and random 5xx – see
+# `manage.py llm_loadtest`.
+
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+import httpx   # google-genai's transport
+
+from app.gemini.packing import estimate_tokens
+
+LLM_DISPATCHER = os.getenv("LLM_DISPATCHER", "1") == "1"
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+LLM_RPM = int(os.getenv("LLM_RPM", "300"))
+LLM_TPM = int(os.getenv("LLM_TPM", "1000000"))
+LLM_BURST_S = float(os.getenv("LLM_BURST_S", "10"))
+LLM_OUTPUT_TOKENS = int(os.getenv("LLM_OUTPUT_TOKENS", "800"))
+
+LLM_START_CONCURRENCY = int(os.getenv("LLM_START_CONCURRENCY", "8"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_LATENCY_TARGET_S = float(os.getenv("LLM_LATENCY_TARGET_S", "20"))
+LLM_AIMD_DECREASE = float(os.getenv("LLM_AIMD_DECREASE", "0.5"))
+LLM_AIMD_COOLDOWN_S = float(os.getenv("LLM_AIMD_COOLDOWN_S", "5"))
+LLM_AIMD_MAX_ERROR_RATE = float(os.getenv("LLM_AIMD_MAX_ERROR_RATE", "0.05"))
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "60"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "120"))
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+RETRY_ERRORS = (asyncio.TimeoutError, ConnectionError, httpx.TransportError)
+
+OK = "ok"
+OVERLOAD = "overload"   # 429 / 5xx / timeout / transport error – shrink the window
+ERROR = "error"         # not the server's fault – no signal
+
+
+# ============================================================
+# RATE LIMITS
+# ============================================================
+
+class TokenBucket:
+    """Per-minute budget refilled continuously; holds LLM_BURST_S of it."""
+
+    def __init__(self, per_minute, burst_s=LLM_BURST_S):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_s)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1.0):
+        amount = min(float(amount), self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def charge(self, amount):
+        """Correct an earlier estimate (may go negative = debt)."""
+        self._refill()
+        self.tokens -= amount
+
+
+class AimdLimiter:
+    """Adaptive cap on in-flight calls."""
+
+    def __init__(self, start=LLM_START_CONCURRENCY, minimum=LLM_MIN_CONCURRENCY,
+                 maximum=LLM_MAX_CONCURRENCY, latency_target=LLM_LATENCY_TARGET_S):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(start, self.minimum), self.maximum))
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.error_rate = 0.0
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, outcome, latency):
+        async with self._cond:
+            self.in_flight -= 1
+            if outcome != ERROR:
+                self.error_rate = 0.9 * self.error_rate + 0.1 * (outcome == OVERLOAD)
+
+            if outcome == OVERLOAD or (outcome == OK and latency > 2 * self.latency_target):
+                self._decrease()
+            elif outcome == OK and latency <= self.latency_target and self.error_rate < LLM_AIMD_MAX_ERROR_RATE:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self._cond.notify_all()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < LLM_AIMD_COOLDOWN_S:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.minimum), self.limit * LLM_AIMD_DECREASE)
+
+
+def error_status(exc):
+    """HTTP status of an API error (google-genai APIError.code), else None."""
+    for attr in ("code", "status_code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def backoff_delay(attempt, base=LLM_BACKOFF_BASE_S, cap=LLM_BACKOFF_MAX_S):
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+# ============================================================
+# BACKENDS – async generate(prompt, config) -> (text, total tokens or None)
+# ============================================================
+
+class GeminiBackend:
+
+    def __init__(self, model):
+        self.model = model
+
+    async def generate(self, prompt, config=None):
+        from app.gemini.client import client
+
+        response = await client.aio.models.generate_content(model=self.model, contents=[prompt], config=config)
+        usage = getattr(response, "usage_metadata", None)
+        return response.text or "", getattr(usage, "total_token_count", None)
+
+
+class FakeApiError(Exception):
+
+    def __init__(self, code):
+        super().__init__(f"fake endpoint returned {code}")
+        self.code = code
+
+
+class FakeGeminiBackend:
+    """
+    Local stand-in for load tests (no network). Enforces its own RPM and
+    concurrency quota with 429s, slows down as load rises, and fails a
+    share of calls with 503.
+    """
+
+    def __init__(self, rpm=600, max_concurrency=16, latency_s=2.0, error_rate=0.01,
+                 response='{"fake": true}'):
+        self.rpm = rpm
+        self.max_concurrency = max_concurrency
+        self.latency_s = latency_s
+        self.error_rate = error_rate
+        self.response = response
+        self.in_flight = 0
+        self._calls = deque()
+
+    async def generate(self, prompt, config=None):
+        now = time.monotonic()
+        while self._calls and now - self._calls[0] > 60:
+            self._calls.popleft()
+        if len(self._calls) >= self.rpm or self.in_flight >= self.max_concurrency:
+            raise FakeApiError(429)
+        self._calls.append(now)
+
+        if random.random() < self.error_rate:
+            raise FakeApiError(503)
+
+        self.in_flight += 1
+        try:
+            load = 1 + self.in_flight / self.max_concurrency
+            await asyncio.sleep(self.latency_s * load * random.lognormvariate(0, 0.3))
+        finally:
+            self.in_flight -= 1
+        return self.response, estimate_tokens(prompt) + estimate_tokens(self.response)
+
+
+# ============================================================
+# DISPATCHER
+# ============================================================
+
+class LlmDispatcher:
+
+    def __init__(self, backend, rpm=LLM_RPM, tpm=LLM_TPM, max_retries=LLM_MAX_RETRIES,
+                 timeout_s=LLM_TIMEOUT_S, **limiter_args):
+        self.backend = backend
+        self.rpm = TokenBucket(rpm)
+        self.tpm = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.timeout_s = timeout_s
+        self._limiter_args = limiter_args
+        self.limiter = None
+
+        self._loop = None
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "ok": 0, "retries": 0, "overloads": 0, "failed": 0}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self.limiter = AimdLimiter(**self._limiter_args)
+                    ready.set()
+                    loop.run_forever()
+
+                threading.Thread(target=run, name="llm-dispatcher", daemon=True).start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def submit(self, prompt: str, config=None):
+        """concurrent.futures.Future resolving to the response text."""
+        return asyncio.run_coroutine_threadsafe(self.generate_async(prompt, config), self._ensure_loop())
+
+    def generate(self, prompt: str, config=None) -> str:
+        return self.submit(prompt, config).result()
+
+    async def generate_async(self, prompt: str, config=None) -> str:
+        estimate = estimate_tokens(prompt) + LLM_OUTPUT_TOKENS
+
+        for attempt in range(self.max_retries + 1):
+            await self.rpm.acquire(1)
+            await self.tpm.acquire(estimate)
+            await self.limiter.acquire()
+
+            self.stats["calls"] += 1
+            started = time.monotonic()
+            outcome = ERROR
+            try:
+                text, used = await asyncio.wait_for(self.backend.generate(prompt, config), self.timeout_s)
+                outcome = OK
+                if used:
+                    self.tpm.charge(used - estimate)
+                self.stats["ok"] += 1
+                return text
+            except Exception as e:
+                # A rejected call used no tokens – refund the estimate so a 429 storm does not drain TPM
+                self.tpm.charge(-estimate)
+                status = error_status(e)
+                if status in RETRY_STATUSES or isinstance(e, RETRY_ERRORS):
+                    outcome = OVERLOAD
+                    self.stats["overloads"] += 1
+                if outcome != OVERLOAD or attempt == self.max_retries:
+                    self.stats["failed"] += 1
+                    raise
+                reason = status or type(e).__name__
+            finally:
+                await self.limiter.release(outcome, time.monotonic() - started)
+
+            delay = backoff_delay(attempt)
+            self.stats["retries"] += 1
+            print(f"🔁 Gemini {reason} – retry {attempt + 1}/{self.max_retries} in {delay:.1f}s "
+                  f"(concurrency {self.limiter.limit:.1f})")
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> dict:
+        limiter = self.limiter
+        return {
+            **self.stats,
+            "concurrency": round(limiter.limit, 2) if limiter else None,
+            "in_flight": limiter.in_flight if limiter else 0,
+            "error_rate": round(limiter.error_rate, 3) if limiter else 0.0,
+        }
+
+
+def make_backend(model, name=LLM_BACKEND):
+    if name == "fake":
+        return FakeGeminiBackend()
+    return GeminiBackend(model)
+
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_llm_dispatcher(model) -> LlmDispatcher:
+    """One dispatcher (one set of buckets / limits) per model."""
+    with _dispatchers_lock:
+        if model not in _dispatchers:
+            _dispatchers[model] = LlmDispatcher(make_backend(model))
+        return _dispatchers[model]
@@ -0,0 +1,409 @@
+# app/gemini/near_duplicates.py
+# ============================================================
+# Perceptual-hash near-duplicate detection (before OCR)
+# ============================================================
+#
+# Re-scans, re-compressed and resized copies of an invoice arrive under
+# different URLs. Each downloaded file gets:
+#
+#   pHash      64 bit, 8×8 low-frequency DCT signs → BK-tree lookup
+#   signature  1600 px wide binarised ink mask      → confirmation
+#
+# Coarse hashes (pHash, dHash) cannot tell two invoices printed from
+# the same supplier template apart – a changed amount moves no bits.
+# A pHash candidate is only accepted if its ink mask, registered with
+# an ECC affine fit and then re-aligned ±1 px per 64 px tile, has no
+# 16 px window with more than OCR_DEDUP_MAX_LOCAL_DIFF differing pixels.
+# Differences are opened with a 2×2 kernel first: edge jitter from
+# re-encoding and rescanning is 1 px thick, a changed glyph stroke is not.
+#
+# Measured on synthetic same-template A4 invoices (200 dpi, 8 and 10 pt,
+# every one-digit change of the total / a quantity, clean and degraded):
+#
+#   copies, 10 pt (re-encode, resize, rescan)   0–6
+#   copies, 8 pt degraded / 720 px q30 source    8–30
+#   one changed digit, 8 pt regular              8 and up (6↔8, 8↔9)
+#   one changed digit, 8 pt bold / 10 pt         11 and up
+#
+# Small print sits at the noise floor, so the default threshold (4)
+# links only clean copies; anything doubtful is OCR'd again. Measure
+# real copy / same-template pairs with `manage.py
+# calibrate_near_duplicates` before raising it.
+#
+# The index is process-wide and holds at most OCR_DEDUP_MAX_ENTRIES
+# invoices: seeded from recent SUCCESS extractions (cross-batch) and
+# extended as invoices are processed (within batch). Copies processed
+# concurrently wait for the original to finish.
+
+import os
+import zlib
+import threading
+from collections import deque
+from datetime import timedelta
+
+import cv2
+import numpy as np
+
+from app.gemini.image_prep import decode_image, to_gray
+from app.gemini.pdf_reader import is_pdf, open_pdf, render_page
+
+OCR_DEDUP_ENABLED = os.getenv("OCR_DEDUP_ENABLED", "1") == "1"
+OCR_PHASH_MAX_DISTANCE = int(os.getenv("OCR_PHASH_MAX_DISTANCE", "8"))
+OCR_DEDUP_MAX_LOCAL_DIFF = int(os.getenv("OCR_DEDUP_MAX_LOCAL_DIFF", "4"))
+OCR_DEDUP_MAX_CANDIDATES = int(os.getenv("OCR_DEDUP_MAX_CANDIDATES", "8"))
+OCR_DEDUP_MAX_ENTRIES = int(os.getenv("OCR_DEDUP_MAX_ENTRIES", "50000"))
+OCR_DEDUP_LOOKBACK_DAYS = int(os.getenv("OCR_DEDUP_LOOKBACK_DAYS", "90"))
+OCR_DEDUP_WAIT = float(os.getenv("OCR_DEDUP_WAIT", "600"))
+
+SIGNATURE_WIDTH = 1600        # ≈ 200 dpi on A4 – 8 pt digit strokes are 2+ px
+SIGNATURE_MAX_HEIGHT = 4800   # long receipts get a narrower mask
+REGISTER_WIDTH = 800          # thumbnail width for the affine fit
+ALIGN_TILE = 64
+ALIGN_SHIFT = 1
+DIFF_WINDOW = 16
+PDF_HASH_MAX_DPI = 300
+
+
+# ============================================================
+# HASHES
+# ============================================================
+
+def _pack_bits(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def phash(gray: np.ndarray) -> int:
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8]
+    return _pack_bits(low > np.median(low.ravel()[1:]))
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def ink_mask(gray: np.ndarray) -> np.ndarray:
+    h, w = gray.shape[:2]
+    width, height = SIGNATURE_WIDTH, max(1, round(h * SIGNATURE_WIDTH / w))
+    if height > SIGNATURE_MAX_HEIGHT:
+        width, height = max(1, round(w * SIGNATURE_MAX_HEIGHT / h)), SIGNATURE_MAX_HEIGHT
+    small = cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+    block = max(3, width // 50 | 1)
+    return cv2.adaptiveThreshold(
+        small, 1, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, block, 15
+    )
+
+
+def encode_mask(mask: np.ndarray) -> bytes:
+    """uint16 height, width + packed bits, zlib'd (≈5–15 KB per page)."""
+    header = np.array(mask.shape, dtype="<u2").tobytes()
+    return zlib.compress(header + np.packbits(mask).tobytes(), 6)
+
+
+def decode_mask(blob: bytes) -> np.ndarray:
+    raw = zlib.decompress(bytes(blob))
+    height, width = (int(v) for v in np.frombuffer(raw[:4], dtype="<u2"))
+    bits = np.unpackbits(np.frombuffer(raw[4:], dtype=np.uint8))
+    return bits[:height * width].reshape(height, width)
+
+
+def register(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    2×3 affine warp of a's frame into b's (same shape), fitted with ECC
+    on blurred thumbnails: covers shift, scale and a slight rotation.
+    """
+    scale = REGISTER_WIDTH / a.shape[1]
+    size = (REGISTER_WIDTH, max(1, round(a.shape[0] * scale)))
+
+    def thumb(mask):
+        small = cv2.resize(mask.astype(np.float32), size, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(small, (0, 0), 1.5)
+
+    ta, tb = thumb(a), thumb(b)
+    (dx, dy), _ = cv2.phaseCorrelate(ta, tb)
+    warp = np.float32([[1, 0, dx], [0, 1, dy]])
+    try:
+        criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 100, 1e-5)
+        _, warp = cv2.findTransformECC(ta, tb, warp, cv2.MOTION_AFFINE, criteria, None, 1)
+    except cv2.error:
+        pass   # did not converge – keep the translation
+    warp[:, 2] /= scale
+    return warp
+
+
+def mask_difference(a: np.ndarray, b: np.ndarray):
+    """
+    Largest number of differing ink pixels inside any DIFF_WINDOW window
+    after registering b onto a, or None if the page shapes differ.
+    """
+    if abs(a.shape[0] / a.shape[1] - b.shape[0] / b.shape[1]) > a.shape[0] / a.shape[1] * 0.02:
+        return None
+
+    h, w = a.shape
+    b = cv2.resize(b, (w, h), interpolation=cv2.INTER_NEAREST)
+    b = cv2.warpAffine(b, register(a, b), (w, h), flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP)
+
+    # Residual misalignment (lens, paper curl) is local: each tile keeps
+    # the ±ALIGN_SHIFT offset with the fewest differences.
+    tile, r = ALIGN_TILE, ALIGN_SHIFT
+    pad_h, pad_w = -h % tile, -w % tile
+    a = cv2.copyMakeBorder(a, 0, pad_h, 0, pad_w, cv2.BORDER_CONSTANT, value=0)
+    b = cv2.copyMakeBorder(b, r, pad_h + r, r, pad_w + r, cv2.BORDER_CONSTANT, value=0)
+    h, w = a.shape
+    kernel = np.ones((2, 2), np.uint8)
+
+    diffs, counts = [], []
+    for sy in range(-r, r + 1):
+        for sx in range(-r, r + 1):
+            shifted = b[r + sy:r + sy + h, r + sx:r + sx + w]
+            diff = (cv2.morphologyEx(a & ~shifted & 1, cv2.MORPH_OPEN, kernel)
+                    | cv2.morphologyEx(shifted & ~a & 1, cv2.MORPH_OPEN, kernel))
+            diffs.append(diff)
+            counts.append(diff.reshape(h // tile, tile, w // tile, tile).sum(axis=(1, 3)))
+
+    best = np.argmin(np.stack(counts), axis=0)
+    best = np.repeat(np.repeat(best, tile, axis=0), tile, axis=1)
+    diff = np.take_along_axis(np.stack(diffs), best[None], axis=0)[0]
+
+    window = (DIFF_WINDOW, DIFF_WINDOW)
+    return int(cv2.boxFilter(diff.astype(np.float32), -1, window, normalize=False).max())
+
+
+def image_fingerprint(data: bytes):
+    """(phash, encoded ink mask) of an image or a PDF's first page, None if undecodable."""
+    try:
+        if is_pdf(data):
+            doc = open_pdf(data)
+            try:
+                page = doc[0]
+                dpi = min(PDF_HASH_MAX_DPI, round(SIGNATURE_WIDTH * 72 / page.rect.width))
+                gray = render_page(page, dpi=dpi)
+            finally:
+                doc.close()
+        else:
+            gray = to_gray(decode_image(data, SIGNATURE_MAX_HEIGHT), SIGNATURE_MAX_HEIGHT)
+    except Exception as e:
+        print("⚠️ Perceptual hash failed:", e)
+        return None
+
+    return phash(gray), encode_mask(ink_mask(gray))
+
+
+# ============================================================
+# BK-TREE
+# ============================================================
+
+class BKTree:
+    """Metric tree over 64-bit hashes for Hamming-radius searches."""
+
+    def __init__(self):
+        self._root = None   # [key, values, {distance: child}]
+        self.size = 0
+
+    def add(self, key: int, value):
+        self.size += 1
+        if self._root is None:
+            self._root = [key, [value], {}]
+            return
+
+        node = self._root
+        while True:
+            dist = hamming(key, node[0])
+            if dist == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(dist)
+            if child is None:
+                node[2][dist] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key: int, max_distance: int) -> list:
+        """[(distance, value), ...] sorted nearest first."""
+        found = []
+        stack = [self._root] if self._root else []
+
+        while stack:
+            node = stack.pop()
+            dist = hamming(key, node[0])
+            if dist <= max_distance:
+                found.extend((dist, value) for value in node[1])
+            for child_dist, child in node[2].items():
+                if dist - max_distance <= child_dist <= dist + max_distance:
+                    stack.append(child)
+
+        return sorted(found, key=lambda item: item[0])
+
+
+# ============================================================
+# INDEX
+# ============================================================
+
+class HashEntry:
+    """
+    One known invoice image. In-flight entries keep their signature in
+    memory; stored ones (seeded or resolved) load it from the DB when
+    compared.
+    """
+    __slots__ = ("phash", "signature", "extraction_id", "done", "seq")
+
+    def __init__(self, phash_value, signature=None, extraction_id=None):
+        self.phash = phash_value
+        self.signature = signature
+        self.extraction_id = extraction_id
+        self.done = threading.Event()
+        self.seq = 0
+        if extraction_id is not None:
+            self.done.set()
+
+
+class NearDuplicateIndex:
+
+    def __init__(self, max_entries=OCR_DEDUP_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._tree = BKTree()
+        self._entries = deque()   # insertion order, oldest first
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _insert(self, entry: HashEntry):
+        """Caller holds the lock."""
+        self._seq += 1
+        entry.seq = self._seq
+        self._tree.add(entry.phash, entry)
+        self._entries.append(entry)
+        if len(self._entries) > self.max_entries:
+            self._trim()
+
+    def _trim(self):
+        """Drop the oldest finished entries down to 90 % and rebuild the tree (no BK-tree delete)."""
+        excess = len(self._entries) - self.max_entries * 9 // 10
+        kept = deque(
+            entry for i, entry in enumerate(self._entries)
+            if i >= excess or not entry.done.is_set()
+        )
+        self._entries = kept
+        self._tree = BKTree()
+        for entry in kept:
+            self._tree.add(entry.phash, entry)
+
+    def _candidates(self, phash_value, newer_than=0) -> list:
+        """Nearest (then newest) usable entries added after seq `newer_than`. Caller holds the lock."""
+        found = [
+            (dist, entry) for dist, entry in self._tree.search(phash_value, OCR_PHASH_MAX_DISTANCE)
+            if entry.seq > newer_than and not (entry.done.is_set() and entry.extraction_id is None)
+        ]
+        found.sort(key=lambda item: (item[0], -item[1].seq))
+        return found[:OCR_DEDUP_MAX_CANDIDATES]
+
+    def add(self, entry: HashEntry):
+        with self._lock:
+            self._insert(entry)
+
+    def claim(self, fingerprint) -> tuple:
+        """
+        Look up near-duplicates of `fingerprint` (from image_fingerprint).
+        Returns (entry, None) after registering a new in-flight entry, or
+        (None, match) where match is {"entry", "phash_distance",
+        "local_diff"} of the original.
+
+        Signatures are loaded and compared outside the lock; entries that
+        arrived meanwhile are checked before registering.
+        """
+        phash_value, signature = fingerprint
+        mask = None
+        newer_than = 0
+
+        while True:
+            with self._lock:
+                candidates = self._candidates(phash_value, newer_than)
+                if not candidates:
+                    entry = HashEntry(phash_value, signature)
+                    self._insert(entry)
+                    return entry, None
+                newer_than = self._seq
+
+            for dist, entry in candidates:
+                other = entry.signature or _load_signature(entry.extraction_id)
+                if not other:
+                    continue
+
+                mask = decode_mask(signature) if mask is None else mask
+                local_diff = mask_difference(mask, decode_mask(other))
+                if local_diff is not None and local_diff <= OCR_DEDUP_MAX_LOCAL_DIFF:
+                    return None, {"entry": entry, "phash_distance": dist, "local_diff": local_diff}
+
+    def claim_or_wait(self, fingerprint, timeout=OCR_DEDUP_WAIT) -> tuple:
+        """
+        Like claim(), but a match on an original still being processed
+        waits for it. Returns (entry, None) to process normally,
+        (None, match) to link to match["entry"].extraction_id, or
+        (None, None) if the original did not finish in time.
+        """
+        while True:
+            entry, match = self.claim(fingerprint)
+            if entry is not None:
+                return entry, None
+
+            original = match["entry"]
+            if not original.done.wait(timeout):
+                return None, None
+            if original.extraction_id is not None:
+                return None, match
+            # Original failed – look again (failed entries are skipped)
+
+    def resolve(self, entry: HashEntry, extraction_id=None):
+        """Publish the outcome of an in-flight original (None = failed)."""
+        entry.extraction_id = extraction_id
+        if extraction_id is not None:
+            entry.signature = None   # stored with the row – keep the index small
+        entry.done.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def _load_signature(extraction_id):
+    from app.models import InvoiceExtraction
+
+    return (
+        InvoiceExtraction.objects.filter(id=extraction_id)
+        .values_list("image_signature", flat=True)
+        .first()
+    )
+
+
+def _load_recent(index: NearDuplicateIndex):
+    """Seed with recent SUCCESS rows (pHash only; signatures load lazily)."""
+    from django.utils import timezone
+    from app.models import InvoiceExtraction
+
+    rows = InvoiceExtraction.objects.filter(
+        status="SUCCESS",
+        image_phash__isnull=False,
+        created_at__gte=timezone.now() - timedelta(days=OCR_DEDUP_LOOKBACK_DAYS),
+    ).order_by("-created_at").values_list("id", "image_phash")[:index.max_entries]
+
+    entries = [HashEntry(int(phash_hex, 16), extraction_id=extraction_id) for extraction_id, phash_hex in rows]
+    for entry in reversed(entries):   # oldest first, so trimming drops the oldest
+        index.add(entry)
+
+    print(f"🧬 Near-duplicate index loaded ({len(index)} recent invoices)")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_duplicate_index() -> NearDuplicateIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = NearDuplicateIndex()
+            try:
+                _load_recent(index)
+            except Exception as e:
+                print("⚠️ Near-duplicate index not seeded:", e)
+            _index = index
+        return _index
@@ -0,0 +1,318 @@
+# app/gemini/ocr_batch.py
+# ============================================================
+# Batched OCR: per-page detection, shared recognition batches
+# ============================================================
+#
+# PaddleOCR.ocr() runs detection → angle cls → recognition for one
+# image at a time. On CPU the recogniser dominates, and its per-call
+# overhead is paid once per small batch of lines. Here detection still
+# runs per page, but the text-line crops of many pages (and of many
+# concurrent callers) are pooled into shared recognition batches of
+# up to OCR_REC_BATCH_SIZE crops. A batch waits (at most
+# OCR_REC_MAX_WAIT_MS) to fill only while another caller is still
+# detecting; a lone caller – e.g. inside an OCR worker process, where
+# the parent already pooled the pages – gets whatever is queued at once.
+
+import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from app.gemini.ocr_engine import (
+    MIN_CONFIDENCE,
+    OCR_LANG,
+    OCR_POOL_SIZE,
+    OCR_REC_BATCH_SIZE,
+    apply_handwriting_fallback,
+    build_ocr_result,
+    paddle_ocr_engine,
+    routing_enabled,
+)
+from app.gemini.ocr_router import choose_lang, sample_crops
+from app.gemini.orientation import box_geometry, needs_angle_cls
+
+OCR_REC_MAX_WAIT_MS = float(os.getenv("OCR_REC_MAX_WAIT_MS", "50"))
+
+# Text gate: pages with fewer regions / less text area skip recognition
+OCR_TEXT_GATE = os.getenv("OCR_TEXT_GATE", "1") == "1"
+OCR_TEXT_MIN_REGIONS = int(os.getenv("OCR_TEXT_MIN_REGIONS", "4"))
+OCR_TEXT_MIN_AREA = float(os.getenv("OCR_TEXT_MIN_AREA", "0.002"))
+
+
+# ============================================================
+# DETECTION + CROPPING
+# ============================================================
+
+def sorted_boxes(dt_boxes) -> list:
+    """Sort quadrilateral boxes top→bottom, left→right (PaddleOCR order)."""
+    boxes = sorted(dt_boxes, key=lambda b: (b[0][1], b[0][0]))
+
+    for i in range(len(boxes) - 1):
+        for j in range(i, -1, -1):
+            if abs(boxes[j + 1][0][1] - boxes[j][0][1]) < 10 and \
+                    boxes[j + 1][0][0] < boxes[j][0][0]:
+                boxes[j], boxes[j + 1] = boxes[j + 1], boxes[j]
+            else:
+                break
+    return boxes
+
+
+def crop_text_line(img: np.ndarray, box) -> np.ndarray:
+    """Perspective-crop one detected text quadrilateral to a flat line image."""
+    pts = np.asarray(box, dtype=np.float32)
+    width = int(max(np.linalg.norm(pts[0] - pts[1]), np.linalg.norm(pts[2] - pts[3])))
+    height = int(max(np.linalg.norm(pts[0] - pts[3]), np.linalg.norm(pts[1] - pts[2])))
+    width, height = max(width, 1), max(height, 1)
+
+    dst = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    matrix = cv2.getPerspectiveTransform(pts, dst)
+    crop = cv2.warpPerspective(
+        img, matrix, (width, height),
+        borderMode=cv2.BORDER_REPLICATE,
+        flags=cv2.INTER_CUBIC,
+    )
+
+    # Vertical text lines are recognised rotated
+    if height / width >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+
+def detect_text_boxes(ocr, img: np.ndarray) -> list:
+    dt_boxes, _ = ocr.text_detector(img)
+    if dt_boxes is None or len(dt_boxes) == 0:
+        return []
+    return sorted_boxes(list(dt_boxes))
+
+
+def text_region_stats(img: np.ndarray, boxes) -> dict:
+    """Number of detected text regions and their share of the page area."""
+    if not len(boxes):
+        return {"text_regions": 0, "text_area": 0.0}
+
+    _, _, areas = box_geometry(boxes)
+    h, w = img.shape[:2]
+    return {
+        "text_regions": len(boxes),
+        "text_area": round(float(areas.sum()) / max(1, h * w), 5),
+    }
+
+
+def too_little_text(stats: dict) -> bool:
+    return OCR_TEXT_GATE and (
+        stats["text_regions"] < OCR_TEXT_MIN_REGIONS
+        or stats["text_area"] < OCR_TEXT_MIN_AREA
+    )
+
+
+def detect_text_regions(img: np.ndarray) -> dict:
+    """Detection-only pass on a pooled engine → region count + area share."""
+    with paddle_ocr_engine() as ocr:
+        boxes = detect_text_boxes(ocr, img)
+    return text_region_stats(img, boxes)
+
+
+# ============================================================
+# RECOGNITION
+# ============================================================
+
+def recognize_crops(crops: list, classify=None, lang=None) -> list:
+    """
+    Recognise line crops → [(text, confidence), ...] with the `lang`
+    recogniser. Only crops whose `classify` flag is set go through the
+    angle classifier first.
+    """
+    if not crops:
+        return []
+    if classify is None:
+        classify = [True] * len(crops)
+    indices = [i for i, flag in enumerate(classify) if flag]
+    routed = bool(lang) and lang != OCR_LANG
+
+    with paddle_ocr_engine() as ocr:
+        # Angle classifier is language independent – routed recognisers have none
+        if ocr.use_angle_cls and indices:
+            fixed, _, _ = ocr.text_classifier([crops[i] for i in indices])
+            crops = list(crops)
+            for i, crop in zip(indices, fixed):
+                crops[i] = crop
+
+        if not routed:
+            rec_res, _ = ocr.text_recognizer(crops)
+
+    if routed:
+        with paddle_ocr_engine(lang=lang) as rec:
+            rec_res, _ = rec.text_recognizer(crops)
+
+    return [(text, float(conf)) for text, conf in rec_res]
+
+
+class RecognitionBatcher:
+    """
+    Collects line crops from any number of callers and recognises them
+    in shared batches (one per recogniser language). Each caller gets a
+    Future resolving to its own slice of the results, in submission order.
+    Callers register with caller() while they may still submit crops.
+    """
+
+    def __init__(self, batch_size=OCR_REC_BATCH_SIZE, max_wait_ms=OCR_REC_MAX_WAIT_MS,
+                 workers=OCR_POOL_SIZE):
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.workers = max(1, int(workers))
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._callers = 0
+
+    @contextmanager
+    def caller(self):
+        with self._lock:
+            self._callers += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._callers -= 1
+
+    def submit(self, crops: list, classify: bool = True, lang: str = OCR_LANG) -> Future:
+        future = Future()
+        if not crops:
+            future.set_result([])
+            return future
+
+        self._ensure_threads()
+        self._queue.put((crops, classify, lang, future, threading.get_ident()))
+        return future
+
+    def _ensure_threads(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._loop, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _loop(self):
+        while True:
+            pending = [self._queue.get()]
+            count = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+
+            while count < self.batch_size:
+                # Waiting only pays off if some other caller may still submit
+                others = self._callers > len({item[4] for item in pending})
+                remaining = deadline - time.monotonic() if others else 0
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                pending.append(item)
+                count += len(item[0])
+
+            by_lang = {}
+            for item in pending:
+                by_lang.setdefault(item[2], []).append(item)
+            for lang, items in by_lang.items():
+                self._run(lang, items)
+
+    def _run(self, lang, pending):
+        crops = [crop for item in pending for crop in item[0]]
+        classify = [item[1] for item in pending for _ in item[0]]
+
+        try:
+            results = []
+            for start in range(0, len(crops), self.batch_size):
+                end = start + self.batch_size
+                results.extend(recognize_crops(crops[start:end], classify[start:end], lang))
+        except Exception as e:
+            for item in pending:
+                item[3].set_exception(e)
+            return
+
+        offset = 0
+        for item in pending:
+            item[3].set_result(results[offset:offset + len(item[0])])
+            offset += len(item[0])
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> RecognitionBatcher:
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = RecognitionBatcher()
+        return _batcher
+
+
+# ============================================================
+# PUBLIC API
+# ============================================================
+
+def extract_text_batch(images: list, handwriting: bool = True, text_gate: bool = True) -> list:
+    """
+    OCR many preprocessed pages at once → list[OcrResult] (same order).
+
+    Recognition of page N overlaps detection of page N+1, and the crops
+    of all pages share recognition batches. With routing on, a small
+    sample of each page's lines picks its recogniser first. Pages whose
+    detection finds too little text (logos, product photos) skip
+    recognition and TrOCR entirely when `text_gate` is set.
+    """
+    batcher = get_batcher()
+    routing = routing_enabled()
+    pending = []
+
+    # Registered until the last page is submitted – see RecognitionBatcher._loop
+    with batcher.caller():
+        for img in images:
+            with paddle_ocr_engine() as ocr:
+                boxes = detect_text_boxes(ocr, img)
+                region_stats = text_region_stats(img, boxes)
+
+                if text_gate and too_little_text(region_stats):
+                    meta = {**region_stats, "text_gate": "rejected"}
+                    pending.append(([], [], meta, batcher.submit([])))
+                    continue
+
+                crops = [crop_text_line(img, box) for box in boxes]
+                run_cls, meta = needs_angle_cls(ocr, boxes, crops)
+                meta.update(region_stats, text_gate="passed" if text_gate else "off")
+
+            lang = OCR_LANG
+            if routing:
+                lang, route_meta = choose_lang(
+                    sample_crops(boxes, crops),
+                    lambda sample, sample_lang: recognize_crops(sample, [run_cls] * len(sample), sample_lang),
+                    OCR_LANG,
+                )
+                meta.update(route_meta)
+
+            pending.append((boxes, crops, meta, batcher.submit(crops, classify=run_cls, lang=lang)))
+
+    results = []
+    for img, (boxes, crops, meta, future) in zip(images, pending):
+        recognized = future.result()
+        out = build_ocr_result(
+            (box, text, conf) for box, (text, conf) in zip(boxes, recognized)
+        )
+        out.meta.update(meta)
+        out.meta["detected_lines"] = len(boxes)
+        if handwriting and meta["text_gate"] != "rejected":
+            unread = [
+                (box, crop)
+                for box, crop, (_, conf) in zip(boxes, crops, recognized)
+                if conf < MIN_CONFIDENCE
+            ]
+            out = apply_handwriting_fallback(img, out, unread if boxes else None)
+        results.append(out)
+
+    return results
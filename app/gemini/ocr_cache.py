@@ -0,0 +1,198 @@
+# app/gemini/ocr_cache.py
+# ============================================================
+# Content-addressed OCR result cache
+#   key = SHA-256(file bytes) + OCR configuration
+#   tier 1: in-process LRU   tier 2: shared on-disk store
+# ============================================================
+
+import os
+import json
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "1") == "1"
+OCR_CACHE_DIR = Path(os.getenv("OCR_CACHE_DIR", str(BASE_DIR / "ocr_cache")))
+OCR_CACHE_MEMORY_ITEMS = int(os.getenv("OCR_CACHE_MEMORY_ITEMS", "256"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+TIER_MEMORY = "memory"
+TIER_DISK = "disk"
+
+
+def cache_key(data: bytes, config: dict) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    config_hash = hashlib.sha256(
+        json.dumps(config, sort_keys=True).encode()
+    ).hexdigest()[:16]
+    return f"{digest}-{config_hash}"
+
+
+class OcrCache:
+    """
+    Two-tier cache of JSON-serialisable OCR results.
+
+    The disk tier is shared by every process on the host (atomic writes,
+    zlib-compressed JSON) and is trimmed oldest-first once it grows past
+    `max_bytes`.
+    """
+
+    def __init__(self, directory=OCR_CACHE_DIR, memory_items=OCR_CACHE_MEMORY_ITEMS,
+                 max_bytes=OCR_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    # --------------------------------------------------------
+    # PUBLIC
+    # --------------------------------------------------------
+
+    def get(self, key: str):
+        """Return (value, tier) or (None, None)."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return self._memory[key], TIER_MEMORY
+
+        value = self._disk_get(key)
+
+        with self._lock:
+            if value is None:
+                self.counters["misses"] += 1
+                return None, None
+
+            self.counters["disk_hits"] += 1
+            self._remember(key, value)
+        return value, TIER_DISK
+
+    def put(self, key: str, value: dict):
+        with self._lock:
+            self._remember(key, value)
+            self.counters["stores"] += 1
+
+        try:
+            self._disk_put(key, value)
+        except OSError as e:
+            print("⚠️ OCR cache write failed:", e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            total = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    # --------------------------------------------------------
+    # MEMORY TIER
+    # --------------------------------------------------------
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # --------------------------------------------------------
+    # DISK TIER
+    # --------------------------------------------------------
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json.z"
+
+    def _disk_get(self, key: str):
+        path = self._path(key)
+        try:
+            payload = path.read_bytes()
+            os.utime(path)  # LRU order for eviction
+            return json.loads(zlib.decompress(payload))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error):
+            return None
+
+    def _disk_put(self, key: str, value: dict):
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        payload = zlib.compress(json.dumps(value, ensure_ascii=False).encode(), 6)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_size()
+            else:
+                self._disk_bytes += len(payload)
+            over_limit = self._disk_bytes > self.max_bytes
+
+        if over_limit:
+            self._evict()
+
+    def _entries(self):
+        for path in self.directory.glob("*/*.json.z"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            yield st.st_mtime, st.st_size, path
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Delete least recently used files until 90 % of max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+
+        with self._lock:
+            self._disk_bytes = total
+            self.counters["evictions"] += evicted
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache():
+    global _cache
+    if not OCR_CACHE_ENABLED:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = OcrCache()
+        return _cache
@@ -6,14 +6,67 @@
 import os
 import platform
 import threading
-import requests
-from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 
-import cv2
 import numpy as np
-from PIL import Image
 from paddleocr import PaddleOCR
 
+from app.gemini import ocr_worker
+from app.gemini.downloader import download
+from app.gemini.handwriting import (
+    TROCR_MAX_LINES,
+    TROCR_MODEL,
+    TROCR_QUANTIZE,
+    load_trocr,
+    trocr_recognize_lines,
+)
+from app.gemini.image_prep import (
+    OCR_MAX_DIM,
+    PREPROCESS_VERSION,
+    decode_image,
+    image_size,
+    preprocess,
+    to_gray,
+)
+from app.gemini.ocr_cache import cache_key, get_ocr_cache
+from app.gemini.quality_gate import check_image
+from app.gemini.pdf_reader import (
+    PAGE_SOURCE_OCR,
+    PAGE_SOURCE_TEXT,
+    PDF_MAX_PAGES,
+    PDF_RENDER_DPI,
+    is_pdf,
+    iter_pdf_pages,
+)
+from app.gemini.ladder import (
+    OCR_LADDER,
+    OCR_LADDER_LOW_DIM,
+    OCR_LADDER_MIN_MEAN_CONF,
+    OCR_LADDER_MIN_NUMBERS,
+    OCR_LADDER_MIN_READ_RATIO,
+    OCR_LADDER_MIN_TAIL_CONF,
+    RUNG_FULL,
+    RUNG_LOW,
+    accept_low_rung,
+    ladder_applies,
+    quality_signals,
+    scale_boxes,
+)
+from app.gemini.ocr_pool import OcrModelPool
+from app.gemini.tiling import (
+    OCR_TILE_MAX_DIM,
+    OCR_TILE_MIN_ASPECT,
+    OCR_TILE_MODE,
+    OCR_TILE_OVERLAP,
+    OCR_TILE_SIZE,
+    OCR_TILE_TRIGGER,
+    merge_strip_lines,
+    should_tile,
+    split_strips,
+)
+
 # ============================================================
 # ENV SAFETY (CRITICAL)
 # ============================================================
@@ -28,98 +81,170 @@ if platform.system() == "Windows":
     os.environ["PYTORCH_NO_SHM"] = "1"   # 🔥 FIXES shm.dll crash
 
 # ============================================================
-# THREAD-LOCAL PaddleOCR (DJANGO SAFE)
+# SHARED PaddleOCR POOL (DJANGO SAFE)
 # ============================================================
+# OCR engines are sized independently of the I/O thread pool
+# (invoice_processor.INVOICE_THREADS), so RAM stays flat no matter how
+# many downloads / LLM calls are in flight.
+
+OCR_POOL_SIZE = int(os.getenv("OCR_POOL_SIZE", "2"))
+OCR_POOL_TIMEOUT = float(os.getenv("OCR_POOL_TIMEOUT", "300"))
+OCR_REC_BATCH_SIZE = int(os.getenv("OCR_REC_BATCH_SIZE", "32"))
 
-_thread_local = threading.local()
+# "paddle" (Paddle Inference) or "onnx" (ONNX Runtime, see onnx_backend.py)
+OCR_BACKEND = os.getenv("OCR_BACKEND", "paddle")
 
+# Multilingual CJK + Asian printed text (best free model); detection
+# always runs here, recognition may be routed (see ocr_router.py)
+OCR_LANG = "ch"
+OCR_ROUTE_POOL_SIZE = int(os.getenv("OCR_ROUTE_POOL_SIZE", "1"))
+# Routed recognisers kept resident per process (least recently used evicted)
+OCR_ROUTE_MAX_LANGS = int(os.getenv("OCR_ROUTE_MAX_LANGS", "2"))
 
-def _init_paddle_ocr() -> PaddleOCR:
-    print("📦 Initializing PaddleOCR (multilingual Asian)")
-    return PaddleOCR(
-        lang="ch",   # Multilingual CJK + Asian printed text (best free model)
+
+def _init_paddle_ocr(lang: str = OCR_LANG) -> PaddleOCR:
+    print(f"📦 Initializing PaddleOCR (lang={lang}, backend={OCR_BACKEND})")
+    kwargs = dict(
+        lang=lang,
         use_angle_cls=True,
+        rec_batch_num=OCR_REC_BATCH_SIZE,
         show_log=False,
     )
 
+    if OCR_BACKEND == "onnx":
+        from app.gemini.onnx_backend import init_onnx_paddle_ocr
+        return init_onnx_paddle_ocr(PaddleOCR, **kwargs)
 
-def get_paddle_ocr() -> PaddleOCR:
-    if not hasattr(_thread_local, "ocr"):
-        _thread_local.ocr = _init_paddle_ocr()
-    return _thread_local.ocr
+    return PaddleOCR(**kwargs)
 
 
-# ============================================================
-# OPTIONAL TrOCR (HANDWRITING) — LAZY + CPU SAFE
-# ============================================================
+class RecognizerEngine:
+    """
+    Recognition-only engine for a routed language. Detection and angle
+    classification are language independent and stay on OCR_LANG.
+    """
+    use_angle_cls = False
 
-_trocr_cache = {}
+    def __init__(self, text_recognizer):
+        self.text_recognizer = text_recognizer
 
 
-def load_trocr():
-    if "model" in _trocr_cache:
-        return _trocr_cache["processor"], _trocr_cache["model"]
+def _init_recognizer(lang: str) -> RecognizerEngine:
+    """Load a `lang` PaddleOCR and keep only its recogniser (public API only)."""
+    print(f"📦 Initializing PaddleOCR recogniser (lang={lang})")
+    engine = PaddleOCR(lang=lang, use_angle_cls=False, rec_batch_num=OCR_REC_BATCH_SIZE, show_log=False)
+    return RecognizerEngine(engine.text_recognizer)
 
-    try:
-        import torch
-        from transformers import TrOCRProcessor, VisionEncoderDecoderModel
 
-        # ---- HARD CPU SAFETY ----
-        torch.set_num_threads(1)
-        torch.set_num_interop_threads(1)
+_paddle_pool = OcrModelPool(
+    _init_paddle_ocr,
+    size=OCR_POOL_SIZE,
+    timeout=OCR_POOL_TIMEOUT,
+    name="PaddleOCR",
+)
 
-        print("✍️ Initializing TrOCR (handwriting fallback)")
 
-        processor = TrOCRProcessor.from_pretrained(
-            "microsoft/trocr-base-handwritten"
-        )
-        model = VisionEncoderDecoderModel.from_pretrained(
-            "microsoft/trocr-base-handwritten"
-        )
+_lang_pools = OrderedDict()   # routed lang → recogniser pool, least recently used first
+_lang_pools_lock = threading.Lock()
 
-        model.to("cpu")
-        model.eval()
 
-        _trocr_cache["processor"] = processor
-        _trocr_cache["model"] = model
-        return processor, model
+def _lang_pool(lang: str) -> OcrModelPool:
+    with _lang_pools_lock:
+        if lang in _lang_pools:
+            _lang_pools.move_to_end(lang)
+            return _lang_pools[lang]
 
-    except Exception as e:
-        print("⚠️ TrOCR unavailable:", e)
-        return None, None
+        _lang_pools[lang] = OcrModelPool(
+            lambda: _init_recognizer(lang),
+            size=OCR_ROUTE_POOL_SIZE,
+            timeout=OCR_POOL_TIMEOUT,
+            name=f"PaddleOCR[{lang}]",
+        )
+        while len(_lang_pools) > max(1, OCR_ROUTE_MAX_LANGS):
+            # Engines still checked out are freed once their holder is done
+            evicted, _ = _lang_pools.popitem(last=False)
+            print(f"♻️ Evicted routed recogniser {evicted}")
+        return _lang_pools[lang]
 
 
-# ============================================================
-# IMAGE PREPROCESSING
-# ============================================================
+def paddle_ocr_engine(timeout=None, lang=None):
+    """
+    Check out a PaddleOCR instance for exclusive use:
 
-def preprocess(img: np.ndarray) -> np.ndarray:
-    h, w = img.shape[:2]
-    max_dim = 2000
+        with paddle_ocr_engine() as ocr:
+            result = ocr.ocr(img)
 
-    if max(h, w) > max_dim:
-        scale = max_dim / max(h, w)
-        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    `lang` picks a per-language recogniser-only engine (created on first
+    use, see RecognizerEngine) for routed recognition; the default is the
+    shared OCR_LANG pool.
+    """
+    if not lang or lang == OCR_LANG:
+        return _paddle_pool.engine(timeout)
+    return _lang_pool(lang).engine(timeout)
 
-    if img.ndim == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-        img = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
 
-    return img
+def routing_enabled() -> bool:
+    """ONNX models are exported for OCR_LANG only, so routing needs Paddle."""
+    from app.gemini.ocr_router import OCR_ROUTING
+    return OCR_ROUTING and OCR_BACKEND == "paddle"
 
 
 # ============================================================
 # PaddleOCR 2.7 RESULT PARSER (FIXED)
 # ============================================================
 
-def parse_paddle_result(result) -> str:
-    texts = []
+MIN_CONFIDENCE = 0.4
 
+# Bump whenever OcrResult gains fields – invalidates the OCR cache
+OCR_RESULT_VERSION = 2
+
+
+@dataclass
+class OcrResult:
+    """
+    Recognised lines of one page, kept in reading order. Boxes are in a
+    width × height frame; box / scale gives source units – pixels of
+    the stored image, or points ("pt") for PDF pages.
+    """
+    text: str = ""
+    lines: list = field(default_factory=list)
+    confidences: list = field(default_factory=list)
+    boxes: list = field(default_factory=list)
+    handwriting: bool = False
+    width: float = 0.0
+    height: float = 0.0
+    unit: str = "px"
+    scale: float = 1.0
+    meta: dict = field(default_factory=dict)   # per-stage decisions
+
+
+@dataclass
+class OcrDocument:
+    """All pages of one invoice plus how they were read (ocr_metrics)."""
+    text: str = ""
+    pages: list = field(default_factory=list)
+    metrics: dict = field(default_factory=dict)
+
+
+def document_to_dict(doc: OcrDocument) -> dict:
+    return asdict(doc)
+
+
+def document_from_dict(data: dict) -> OcrDocument:
+    return OcrDocument(
+        text=data.get("text", ""),
+        pages=[OcrResult(**page) for page in data.get("pages", [])],
+        metrics=dict(data.get("metrics", {})),
+    )
+
+
+def parse_paddle_lines(result):
+    """Yield (box, text, confidence) for every well-formed PaddleOCR line."""
     if not result or not isinstance(result, list):
-        return ""
+        return
 
     for page in result:
-        for line in page:
+        for line in page or []:
             if not line or len(line) < 2:
                 continue
 
@@ -134,57 +259,412 @@ def parse_paddle_result(result) -> str:
             except Exception:
                 continue
 
-            if conf >= 0.4 and text and text.strip():
-                texts.append(text.strip())
+            yield line[0], text, conf
+
 
-    return "\n".join(texts)
+def build_ocr_result(lines) -> OcrResult:
+    """Build an OcrResult from (box, text, confidence) triples."""
+    out = OcrResult()
+
+    for box, text, conf in lines:
+        if conf >= MIN_CONFIDENCE and text and text.strip():
+            out.lines.append(text.strip())
+            out.confidences.append(conf)
+            out.boxes.append([[float(x), float(y)] for x, y in box])
+
+    out.text = "\n".join(out.lines)
+    return out
+
+
+def parse_paddle_ocr_result(result) -> OcrResult:
+    return build_ocr_result(parse_paddle_lines(result))
+
+
+def parse_paddle_result(result) -> str:
+    return parse_paddle_ocr_result(result).text
 
 
 # ============================================================
-# HANDWRITING OCR
+# HANDWRITING OCR (TrOCR stage lives in handwriting.py)
 # ============================================================
 
-def trocr_handwritten_text(img: Image.Image) -> str:
-    processor, model = load_trocr()
-    if not processor or not model:
-        return ""
+def set_frame(out: OcrResult, frame: np.ndarray, img: np.ndarray) -> OcrResult:
+    """Record the page array `out`'s boxes refer to, relative to the decoded `img`."""
+    out.height, out.width = frame.shape[:2]
+    out.scale = frame.shape[1] / img.shape[1]
+    return out
 
-    try:
-        import torch
 
-        pixel_values = processor(images=img, return_tensors="pt").pixel_values
-        with torch.no_grad():
-            ids = model.generate(pixel_values, max_length=64)
+def needs_handwriting_fallback(text: str) -> bool:
+    return len(text) < 30 and sum(c.isdigit() for c in text) < 5
 
-        return processor.batch_decode(ids, skip_special_tokens=True)[0].strip()
 
-    except Exception as e:
-        print("⚠️ TrOCR failed:", e)
-        return ""
+# ============================================================
+# PAGE OCR (runs in-process or inside an ocr_worker process)
+# ============================================================
+
+def apply_handwriting_fallback(img_np: np.ndarray, out: OcrResult, candidates=None) -> OcrResult:
+    """
+    Append TrOCR text when the printed-text pass found almost nothing.
+
+    `candidates` are (box, line_crop) pairs PaddleOCR detected but could
+    not read confidently; they are recognised line by line in batches.
+    Without detection boxes the whole page is read as before.
+    """
+    if not needs_handwriting_fallback(out.text):
+        return out
+
+    if candidates is None:
+        h, w = img_np.shape[:2]
+        candidates = [([[0, 0], [w, 0], [w, h], [0, h]], img_np)]
+    candidates = candidates[:TROCR_MAX_LINES]
+
+    recognized = trocr_recognize_lines([crop for _, crop in candidates])
+    for (box, _), (text, conf) in zip(candidates, recognized):
+        if not text:
+            continue
+        out.lines.append(text)
+        out.confidences.append(conf)
+        out.boxes.append([[float(x), float(y)] for x, y in box])
+        out.handwriting = True
+
+    out.text = "\n".join(out.lines)
+    return out
+
+
+def ocr_page(img_np: np.ndarray) -> OcrResult:
+    """
+    OCR one preprocessed page. Its text lines share recognition batches
+    with any other page being OCR'd concurrently in this process.
+    """
+    from app.gemini.ocr_batch import extract_text_batch
+    return extract_text_batch([img_np])[0]
+
+
+def run_ocr(img_np: np.ndarray) -> OcrResult:
+    """Send a page to the OCR worker processes, or OCR it here if disabled."""
+    if ocr_worker.enabled():
+        return ocr_worker.run(img_np)
+    return ocr_page(img_np)
+
+
+def run_ocr_batch(images: list, handwriting: bool = True, text_gate: bool = True) -> list:
+    """
+    Batched counterpart of run_ocr → list[OcrResult] in input order.
+    In-process, pages are split into one chunk per pooled engine so
+    detection runs in parallel too.
+    """
+    if ocr_worker.enabled():
+        return ocr_worker.run_batch(images, handwriting=handwriting, text_gate=text_gate)
+
+    from app.gemini.ocr_batch import extract_text_batch
+
+    def ocr_chunk(chunk):
+        return extract_text_batch(chunk, handwriting=handwriting, text_gate=text_gate)
+
+    if len(images) < 2 or OCR_POOL_SIZE < 2:
+        return ocr_chunk(images)
+
+    size = -(-len(images) // OCR_POOL_SIZE)
+    chunks = [images[i:i + size] for i in range(0, len(images), size)]
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        parts = executor.map(ocr_chunk, chunks)
+        return [result for part in parts for result in part]
+
+
+def detect_text_regions(img_np: np.ndarray) -> dict:
+    """
+    Detection only (no recognition) on a preprocessed page →
+    {"text_regions": n, "text_area": share of page covered by text}.
+    """
+    if ocr_worker.enabled():
+        return ocr_worker.run_detect(img_np)
+
+    from app.gemini.ocr_batch import detect_text_regions as detect
+    return detect(img_np)
+
+
+def warmup(trocr: bool = False):
+    """Load (and download on first run) the OCR models once."""
+    with paddle_ocr_engine():
+        pass
+    if routing_enabled():
+        # Latin pages are the bulk of the volume – load their model up front
+        from app.gemini.ocr_router import OCR_ROUTE_LANGS
+        if "en" in OCR_ROUTE_LANGS:
+            with paddle_ocr_engine(lang="en"):
+                pass
+    if trocr:
+        load_trocr()
 
 
 # ============================================================
 # PUBLIC API
 # ============================================================
 
-def extract_text_from_url(url: str) -> str:
+def ocr_tiled(img: np.ndarray) -> OcrResult:
+    """
+    OCR an oversized page as overlapping native-resolution strips
+    (see tiling.py) instead of shrinking it to OCR_MAX_DIM.
+    """
+    gray = to_gray(img, OCR_TILE_MAX_DIM)
+    strips = split_strips(gray)
+
+    # Handwriting is judged on the merged page, not per strip; a blank
+    # strip is normal on a long receipt, so no per-strip text gate
+    strip_results = run_ocr_batch(
+        [preprocess(strip, OCR_TILE_MAX_DIM) for _, _, strip in strips],
+        handwriting=False,
+        text_gate=False,
+    )
+
+    out = build_ocr_result(merge_strip_lines(strips, [
+        list(zip(result.boxes, result.lines, result.confidences))
+        for result in strip_results
+    ]))
+
+    cls_decisions = [result.meta.get("angle_cls") for result in strip_results]
+    langs = [result.meta["ocr_lang"] for result in strip_results if result.meta.get("ocr_lang")]
+    out.meta["tiles"] = len(strips)
+    if langs:
+        out.meta["ocr_lang"] = max(set(langs), key=langs.count)
+    if "run" in cls_decisions:
+        out.meta["angle_cls"] = "run"
+    elif "skipped" in cls_decisions:
+        out.meta["angle_cls"] = "skipped"
+
+    if needs_handwriting_fallback(out.text):
+        # Same frame as the merged boxes, so TrOCR's page box lines up
+        out = apply_handwriting_fallback(preprocess(gray, OCR_TILE_MAX_DIM), out)
+    return set_frame(out, gray, img)
+
+
+def ocr_laddered(img: np.ndarray) -> OcrResult:
+    """
+    OCR at OCR_LADDER_LOW_DIM first and re-run at OCR_MAX_DIM only when
+    the cheap pass looks incomplete (see ladder.py).
+    """
+    gray = to_gray(img, OCR_MAX_DIM)
+
+    # No TrOCR on the low rung – an accepted page has plenty of text
+    low = run_ocr_batch([preprocess(gray, OCR_LADDER_LOW_DIM)], handwriting=False)[0]
+    if low.meta.get("text_gate") == "rejected":
+        low.meta["ocr_rung"] = RUNG_LOW
+        return set_frame(low, gray, img)
+
+    signals = quality_signals(low)
+
+    if accept_low_rung(signals):
+        low = scale_boxes(low, max(gray.shape[:2]) / OCR_LADDER_LOW_DIM)
+        low.meta.update(ocr_rung=RUNG_LOW, ladder=signals)
+        return set_frame(low, gray, img)
+
+    full = run_ocr(preprocess(gray))
+    full.meta.update(ocr_rung=RUNG_FULL, ladder=signals)
+    return set_frame(full, gray, img)
+
+
+def ocr_image(img: np.ndarray) -> OcrResult:
+    """OCR a decoded gray or RGB page (preprocessed, tiled or laddered here)."""
+    height, width = img.shape[:2]
+    if should_tile(width, height):
+        return ocr_tiled(img)
+    if ladder_applies(img, OCR_MAX_DIM):
+        return ocr_laddered(img)
+    page_img = preprocess(img)
+    return set_frame(run_ocr(page_img), page_img, img)
+
+
+def text_layer_result(lines, size) -> OcrResult:
+    """OcrResult for a PDF page read from its embedded text layer (boxes in points)."""
+    out = build_ocr_result(
+        ([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], text, 1.0)
+        for text, (x0, y0, x1, y1) in lines
+    )
+    out.width, out.height = size
+    out.unit = "pt"
+    return out
+
+
+def page_stage_metrics(pages: list) -> dict:
+    """Roll per-page stage decisions up into the invoice's ocr_metrics."""
+    metrics = {}
+    skipped = sum(1 for page in pages if page.meta.get("angle_cls") == "skipped")
+    ran = sum(1 for page in pages if page.meta.get("angle_cls") == "run")
+    if skipped or ran:
+        metrics["angle_cls_skipped_pages"] = skipped
+        metrics["angle_cls_run_pages"] = ran
+
+    gated = [page.meta.get("text_gate") for page in pages]
+    if "rejected" in gated:
+        metrics["text_gate_rejected_pages"] = gated.count("rejected")
+        metrics["text_gate"] = [
+            {"text_regions": page.meta["text_regions"], "text_area": page.meta["text_area"]}
+            for page in pages if page.meta.get("text_gate") == "rejected"
+        ]
+
+    rungs = [page.meta.get("ocr_rung") for page in pages]
+    if RUNG_LOW in rungs or RUNG_FULL in rungs:
+        metrics["ladder_low_pages"] = rungs.count(RUNG_LOW)
+        metrics["ladder_full_pages"] = rungs.count(RUNG_FULL)
+
+    langs = sorted({page.meta["ocr_lang"] for page in pages if page.meta.get("ocr_lang")})
+    if langs:
+        metrics["ocr_langs"] = langs
+
+    tiled = [page.meta["tiles"] for page in pages if page.meta.get("tiles")]
+    if tiled:
+        metrics["tiled_pages"] = len(tiled)
+        metrics["tiles"] = sum(tiled)
+    return metrics
+
+
+def _pdf_path(sources: list) -> str:
+    if sources and all(src == PAGE_SOURCE_TEXT for src in sources):
+        return "pdf_text"
+    if sources and all(src == PAGE_SOURCE_OCR for src in sources):
+        return "pdf_ocr"
+    return "pdf_mixed"
+
+
+def ocr_config() -> dict:
+    """Everything that changes OCR output for the same bytes (cache key part)."""
+    from app.gemini.ocr_batch import OCR_TEXT_GATE, OCR_TEXT_MIN_AREA, OCR_TEXT_MIN_REGIONS
+    from app.gemini.ocr_router import (
+        OCR_ROUTE_HINT_LANGS, OCR_ROUTE_LANGS, OCR_ROUTE_MAX_PROBES, OCR_ROUTE_MIN_CONF,
+    )
+    from app.gemini.orientation import (
+        OCR_ORIENT_CHECK, OCR_ORIENT_CLS_THRESH, OCR_ORIENT_MAX_SPREAD, OCR_ORIENT_SAMPLE,
+    )
+
+    return {
+        "lang": OCR_LANG,
+        "routing": (
+            f"{','.join(OCR_ROUTE_LANGS)}@{OCR_ROUTE_MIN_CONF}"
+            f"/probe:{OCR_ROUTE_MAX_PROBES}:{','.join(OCR_ROUTE_HINT_LANGS)}"
+            if routing_enabled() else None
+        ),
+        "backend": OCR_BACKEND,
+        "angle_cls": (
+            f"check:{OCR_ORIENT_SAMPLE}/{OCR_ORIENT_MAX_SPREAD}/{OCR_ORIENT_CLS_THRESH}"
+            if OCR_ORIENT_CHECK else "always"
+        ),
+        "preprocess": PREPROCESS_VERSION,
+        "result": OCR_RESULT_VERSION,
+        "min_confidence": MIN_CONFIDENCE,
+        "trocr": f"{TROCR_MODEL}{':int8' if TROCR_QUANTIZE else ''}",
+        "pdf_dpi": PDF_RENDER_DPI,
+        "pdf_max_pages": PDF_MAX_PAGES,
+        "text_gate": f"{OCR_TEXT_MIN_REGIONS}/{OCR_TEXT_MIN_AREA}" if OCR_TEXT_GATE else None,
+        "ladder": (
+            f"{OCR_LADDER_LOW_DIM}:{OCR_LADDER_MIN_MEAN_CONF}/{OCR_LADDER_MIN_TAIL_CONF}/"
+            f"{OCR_LADDER_MIN_READ_RATIO}/{OCR_LADDER_MIN_NUMBERS}"
+            if OCR_LADDER else None
+        ),
+        "tiles": (
+            f"{OCR_TILE_SIZE}/{OCR_TILE_OVERLAP}@{OCR_TILE_TRIGGER}|{OCR_TILE_MIN_ASPECT}<={OCR_TILE_MAX_DIM}"
+            if OCR_TILE_MODE else None
+        ),
+    }
+
+
+def extract_document_from_bytes(data: bytes) -> OcrDocument:
+    cache = get_ocr_cache()
+    if cache is None:
+        with ocr_worker.caller():
+            return _extract_document(data)
+
+    key = cache_key(data, ocr_config())
+    cached, tier = cache.get(key)
+    if cached is not None:
+        doc = document_from_dict(cached)
+        doc.metrics["ocr_cache"] = tier
+        return doc
+
+    with ocr_worker.caller():
+        doc = _extract_document(data)
+    if doc.text:
+        cache.put(key, document_to_dict(doc))
+    doc.metrics["ocr_cache"] = "miss"
+    return doc
+
+
+def _extract_document(data: bytes) -> OcrDocument:
+    doc = OcrDocument()
+
+    if is_pdf(data):
+        sources = []
+        pdf_info = {}
+        for _, result, source in iter_pdf_pages(data, ocr_image, text_layer_result, info=pdf_info):
+            if source == PAGE_SOURCE_OCR:
+                result.unit = "pt"
+                result.scale *= PDF_RENDER_DPI / 72   # rendered pixels per point
+            doc.pages.append(result)
+            sources.append(source)
+
+        doc.text = "\n\n".join(page.text for page in doc.pages if page.text)
+        doc.metrics = {
+            "ocr_path": _pdf_path(sources),
+            "pages": len(sources),
+            "text_layer_pages": sources.count(PAGE_SOURCE_TEXT),
+            "ocr_pages": sources.count(PAGE_SOURCE_OCR),
+            **page_stage_metrics(doc.pages),
+        }
+        if pdf_info.get("pages_skipped"):
+            doc.metrics["pdf_page_count"] = pdf_info["page_count"]
+            doc.metrics["pages_truncated"] = pdf_info["pages_skipped"]
+        return doc
+
+    # Only pages that will be tiled are decoded near native resolution;
+    # everything else keeps the DCT-reduced decode at OCR_MAX_DIM
+    stored_size = image_size(data)
+    img = decode_image(data, OCR_TILE_MAX_DIM if should_tile(*stored_size) else OCR_MAX_DIM)
+
+    ok, reason, gate_stats = check_image(img)
+    if not ok:
+        print(f"🚫 Quality gate: {reason}")
+        doc.metrics = {
+            "ocr_path": "rejected",
+            "pages": 1,
+            "ocr_pages": 0,
+            "quality_gate": {"passed": False, "reason": reason, **gate_stats},
+        }
+        return doc
+
+    page = ocr_image(img)
+    # JPEGs may have been DCT-reduced on decode – scale against the stored image
+    page.scale *= max(img.shape[:2]) / max(stored_size)
+
+    doc.pages = [page]
+    doc.text = page.text
+    doc.metrics = {
+        "ocr_path": "image_ocr",
+        "pages": 1,
+        "ocr_pages": 1,
+        **page_stage_metrics(doc.pages),
+    }
+    if gate_stats:
+        doc.metrics["quality_gate"] = {"passed": True, **gate_stats}
+    return doc
+
+
+def extract_document_from_url(url: str, fetch=None) -> OcrDocument:
+    """
+    Download + OCR one invoice. `fetch(url) -> bytes` defaults to the
+    pooled downloader; batches pass a Prefetcher's get().
+    """
     try:
-        response = requests.get(url, timeout=20)
-        response.raise_for_status()
+        data = (fetch or download)(url)
+        return extract_document_from_bytes(data)
 
-        img = Image.open(BytesIO(response.content)).convert("RGB")
-        img_np = preprocess(np.array(img))
+    except Exception as e:
+        print("❌ OCR URL error:", e)
+        return OcrDocument(metrics={"ocr_path": "error", "error": str(e)})
 
-        result = get_paddle_ocr().ocr(img_np)
-        text = parse_paddle_result(result)
 
-        if len(text) < 30 and sum(c.isdigit() for c in text) < 5:
-            handwritten = trocr_handwritten_text(img)
-            if handwritten:
-                text = f"{text}\n{handwritten}".strip()
+def extract_text_from_bytes(data: bytes) -> str:
+    return extract_document_from_bytes(data).text
 
-        return text
 
-    except Exception as e:
-        print("❌ OCR URL error:", e)
-        return ""
+def extract_text_from_url(url: str) -> str:
+    return extract_document_from_url(url).text
@@ -0,0 +1,135 @@
+# app/gemini/ocr_layout.py
+# ============================================================
+# Compact columnar OCR layout, stored per InvoiceExtraction
+# ============================================================
+#
+# Keeps every recognised line of an invoice – page, box, confidence,
+# text – so later stages can use the layout without re-running OCR.
+#
+#   header   magic "OCL1", line / page counts, JSON page info
+#            (per page: handwriting, width, height, unit, scale)
+#   page     uint16[n]        page index of each line
+#   boxes    uint16[n, 4, 2]  quadrilateral corners, whole pixels
+#   conf     float16[n]
+#   offsets  uint32[n + 1]    line boundaries in the text blob
+#   text     utf-8 blob
+#
+# compressed with blob_codec (zstd / zlib). A typical one-page invoice
+# is a few KB, against tens of KB as JSON.
+#
+# Boxes stay in the frame OCR saw (width × height); box / scale maps
+# them onto the stored file – image pixels, or points for PDF pages
+# (unit "pt").
+
+import json
+import struct
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from app.gemini.blob_codec import compress_blob, decompress_blob
+
+LAYOUT_MAGIC = b"OCL1"
+_HEADER = struct.Struct("<4sIII")   # magic, lines, pages, page-info bytes
+
+
+@dataclass
+class OcrLayout:
+    """Column arrays for all lines of an invoice, in reading order."""
+    page: np.ndarray = field(default_factory=lambda: np.zeros(0, np.uint16))
+    boxes: np.ndarray = field(default_factory=lambda: np.zeros((0, 4, 2), np.float32))
+    confidences: np.ndarray = field(default_factory=lambda: np.zeros(0, np.float32))
+    lines: list = field(default_factory=list)
+    pages: list = field(default_factory=list)   # per page: {"handwriting", "width", "height", "unit", "scale"}
+
+    @property
+    def text(self) -> str:
+        texts = (self.page_text(i) for i in range(len(self.pages)))
+        return "\n\n".join(text for text in texts if text)
+
+    def page_text(self, page_no: int) -> str:
+        return "\n".join(line for line, p in zip(self.lines, self.page) if p == page_no)
+
+    def source_boxes(self, page_no: int) -> np.ndarray:
+        """One page's boxes in stored-file units (image pixels / PDF points)."""
+        return self.boxes[self.page == page_no] / self.pages[page_no]["scale"]
+
+
+def encode_layout(pages: list) -> bytes:
+    """Encode a document's OcrResult pages."""
+    page_idx, boxes, confs, lines = [], [], [], []
+
+    for i, page in enumerate(pages):
+        for line, conf, box in zip(page.lines, page.confidences, page.boxes):
+            page_idx.append(i)
+            boxes.append(box)
+            confs.append(conf)
+            lines.append(line)
+
+    encoded = [line.encode("utf-8") for line in lines]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+
+    box_arr = np.rint(np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2))
+    page_info = json.dumps(
+        [
+            {
+                "handwriting": bool(page.handwriting),
+                "width": round(page.width),
+                "height": round(page.height),
+                "unit": page.unit,
+                "scale": round(page.scale, 6),
+            }
+            for page in pages
+        ],
+        separators=(",", ":"),
+    ).encode()
+
+    raw = b"".join([
+        _HEADER.pack(LAYOUT_MAGIC, len(lines), len(pages), len(page_info)),
+        page_info,
+        np.asarray(page_idx, dtype=np.uint16).tobytes(),
+        np.clip(box_arr, 0, 65535).astype(np.uint16).tobytes(),
+        np.asarray(confs, dtype=np.float16).tobytes(),
+        offsets.tobytes(),
+        b"".join(encoded),
+    ])
+    return compress_blob(raw)
+
+
+def decode_layout(blob) -> OcrLayout:
+    raw = decompress_blob(blob)
+    magic, n, n_pages, info_len = _HEADER.unpack_from(raw)
+    if magic != LAYOUT_MAGIC:
+        raise ValueError("Not an OCR layout blob")
+
+    pos = _HEADER.size
+    pages = json.loads(raw[pos:pos + info_len])
+    pos += info_len
+
+    def take(dtype, count):
+        nonlocal pos
+        arr = np.frombuffer(raw, dtype=dtype, count=count, offset=pos)
+        pos += arr.nbytes
+        return arr
+
+    page = take(np.uint16, n)
+    boxes = take(np.uint16, n * 8).reshape(n, 4, 2).astype(np.float32)
+    confs = take(np.float16, n).astype(np.float32)
+    offsets = take(np.uint32, n + 1)
+    text = raw[pos:]
+
+    lines = [text[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(n)]
+    return OcrLayout(page=page, boxes=boxes, confidences=confs, lines=lines, pages=pages)
+
+
+def load_invoice_layout(extraction_id):
+    """OcrLayout of a stored InvoiceExtraction, or None if none was kept."""
+    from app.models import InvoiceExtraction
+
+    blob = (
+        InvoiceExtraction.objects.filter(id=extraction_id)
+        .values_list("ocr_layout", flat=True)
+        .first()
+    )
+    return decode_layout(blob) if blob else None
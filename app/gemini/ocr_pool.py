@@ -0,0 +1,97 @@
+# app/gemini/ocr_pool.py
+# ============================================================
+# Process-wide OCR model pool (checkout / checkin)
+# ============================================================
+
+import queue
+import threading
+from contextlib import contextmanager
+
+
+class OcrPoolTimeout(RuntimeError):
+    """Raised when no OCR engine becomes free within the wait timeout."""
+
+
+class OcrModelPool:
+    """
+    Bounded pool of heavy OCR engines shared by every thread in the process.
+
+    Engines are built lazily by `factory` up to `size` instances. A caller
+    checks one out exclusively, uses it and checks it back in; when all
+    engines are busy the caller waits up to `timeout` seconds.
+    """
+
+    def __init__(self, factory, size=2, timeout=300, name="ocr"):
+        self.factory = factory
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.name = name
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+
+    # --------------------------------------------------------
+    # CHECKOUT / CHECKIN
+    # --------------------------------------------------------
+
+    def checkout(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            engine = self._create_or_wait(timeout)
+
+        with self._lock:
+            self._in_use += 1
+        return engine
+
+    def checkin(self, engine):
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(engine)
+
+    @contextmanager
+    def engine(self, timeout=None):
+        engine = self.checkout(timeout)
+        try:
+            yield engine
+        finally:
+            self.checkin(engine)
+
+    def _create_or_wait(self, timeout):
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return self.factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise OcrPoolTimeout(
+                f"No {self.name} engine free after {timeout}s (pool size={self.size})"
+            )
+
+    # --------------------------------------------------------
+    # INTROSPECTION
+    # --------------------------------------------------------
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+            }
@@ -0,0 +1,169 @@
+# app/gemini/ocr_router.py
+# ============================================================
+# Script-aware recognition model routing
+# ============================================================
+#
+# The "ch" recogniser is large and reads CJK + Latin, but most invoices
+# are Latin-only and Indic scripts are not in its dictionary at all.
+# Before a page is recognised, a handful of its largest line crops are
+# read with the default model and the dominant script decides which
+# recogniser reads the whole page:
+#
+#   Latin only           → "en"   (small English model)
+#   CJK / Hangul / kana  → "ch" / "korean" / "japan"
+#   low-confidence read  → probe at most OCR_ROUTE_MAX_PROBES recognisers
+#                          suggested by a cheap hint, keep the best one
+#                          whose output is in its own script
+#
+# Probe hints: non-Latin scripts seen in the low-confidence read, langs
+# that recently won a probe in this process, and OCR_ROUTE_HINT_LANGS
+# (scripts the deployment expects, e.g. "devanagari"). A read that is
+# mostly Latin letters is a poor scan, not a foreign script – no probes.
+#
+# Detection and angle classification always run on the default engine;
+# routed languages load a recogniser only, and at most
+# OCR_ROUTE_MAX_LANGS of them stay resident (see ocr_engine).
+
+import os
+import threading
+from collections import Counter, deque
+
+import numpy as np
+
+from app.gemini.orientation import box_geometry
+from app.gemini.script_registry import SCRIPT_RANGES
+
+OCR_ROUTING = os.getenv("OCR_ROUTING", "1") == "1"
+OCR_ROUTE_LANGS = [
+    lang.strip()
+    for lang in os.getenv("OCR_ROUTE_LANGS", "en,devanagari,ta,te,korean,japan").split(",")
+    if lang.strip()
+]
+OCR_ROUTE_SAMPLE = int(os.getenv("OCR_ROUTE_SAMPLE", "8"))
+OCR_ROUTE_MIN_CONF = float(os.getenv("OCR_ROUTE_MIN_CONF", "0.75"))
+OCR_ROUTE_MIN_SHARE = float(os.getenv("OCR_ROUTE_MIN_SHARE", "0.1"))
+OCR_ROUTE_MAX_PROBES = int(os.getenv("OCR_ROUTE_MAX_PROBES", "2"))
+OCR_ROUTE_HINT_LANGS = [
+    lang.strip() for lang in os.getenv("OCR_ROUTE_HINT_LANGS", "").split(",") if lang.strip()
+]
+LATIN_SCAN_SHARE = 0.5   # Latin share above which a poor read is not probed
+
+_recent_winners = deque(maxlen=8)
+_recent_lock = threading.Lock()
+
+LATIN = "LATIN"
+
+# script_registry name → PaddleOCR recogniser lang
+SCRIPT_LANGS = {
+    LATIN: "en",
+    "HANZI_KANJI": "ch",
+    "HIRAGANA": "japan",
+    "KATAKANA": "japan",
+    "HANGUL": "korean",
+    "DEVANAGARI": "devanagari",
+    "TAMIL": "ta",
+    "TELUGU": "te",
+    "KANNADA": "ka",
+    "ARABIC": "arabic",
+    "CYRILLIC": "cyrillic",
+}
+
+
+def char_script(ch: str):
+    if ch.isascii():
+        return LATIN if ch.isalpha() else None
+
+    code = ord(ch)
+    for script, ranges in SCRIPT_RANGES.items():
+        if any(start <= code <= end for start, end in ranges):
+            return script
+    return None
+
+
+def dominant_script(texts) -> tuple:
+    """
+    (script, share) of the most frequent non-Latin script, or Latin when
+    no other script reaches OCR_ROUTE_MIN_SHARE of the letters.
+    """
+    counts = Counter(
+        script for text in texts for script in map(char_script, text) if script
+    )
+    total = sum(counts.values())
+    if not total:
+        return None, 0.0
+
+    others = [(n, script) for script, n in counts.items() if script != LATIN]
+    if others:
+        n, script = max(others)
+        if n / total >= OCR_ROUTE_MIN_SHARE:
+            return script, n / total
+
+    return LATIN, counts[LATIN] / total
+
+
+def sample_crops(boxes, crops) -> list:
+    """The OCR_ROUTE_SAMPLE largest line crops (largest read most reliably)."""
+    if len(crops) <= OCR_ROUTE_SAMPLE:
+        return list(crops)
+
+    _, _, areas = box_geometry(boxes)
+    largest = np.argsort(areas)[::-1][:OCR_ROUTE_SAMPLE]
+    return [crops[i] for i in largest]
+
+
+def _mean_conf(recognized) -> float:
+    return float(np.mean([conf for _, conf in recognized])) if recognized else 0.0
+
+
+def probe_candidates(texts, skip) -> list:
+    """Recognisers worth probing for a low-confidence read (see module notes)."""
+    counts = Counter(script for text in texts for script in map(char_script, text) if script)
+    total = sum(counts.values())
+    if total and counts[LATIN] / total >= LATIN_SCAN_SHARE:
+        return []
+
+    with _recent_lock:
+        recent = list(reversed(_recent_winners))
+
+    seen = [SCRIPT_LANGS.get(script) for script, _ in counts.most_common() if script != LATIN]
+    candidates = []
+    for lang in seen + recent + OCR_ROUTE_HINT_LANGS:
+        if lang and lang in OCR_ROUTE_LANGS and lang not in skip and lang not in candidates:
+            candidates.append(lang)
+    return candidates[:max(0, OCR_ROUTE_MAX_PROBES)]
+
+
+def choose_lang(sample: list, recognize, default_lang: str) -> tuple:
+    """
+    Pick the recogniser for a page from its sample crops.
+    `recognize(crops, lang) -> [(text, conf)]`. Returns (lang, meta).
+    """
+    if not OCR_ROUTING or not sample:
+        return default_lang, {}
+
+    first = recognize(sample, default_lang)
+    script, _ = dominant_script(text for text, _ in first)
+    conf = _mean_conf(first)
+    lang = SCRIPT_LANGS.get(script, default_lang)
+
+    meta = {"script": script, "route_conf": round(conf, 3)}
+    if conf >= OCR_ROUTE_MIN_CONF:
+        chosen = lang if lang in OCR_ROUTE_LANGS else default_lang
+        return chosen, {**meta, "ocr_lang": chosen}
+
+    # Default model could not read it – try the hinted scripts it does not know
+    best_lang, best_conf = default_lang, conf
+    probes = probe_candidates([text for text, _ in first], skip=(default_lang, lang, "en"))
+    for probe in probes:
+        probed = recognize(sample, probe)
+        probe_script, _ = dominant_script(text for text, _ in probed)
+        probe_conf = _mean_conf(probed)
+        if SCRIPT_LANGS.get(probe_script) == probe and probe_conf > best_conf:
+            best_lang, best_conf, script = probe, probe_conf, probe_script
+
+    if best_lang != default_lang and best_lang in probes:
+        with _recent_lock:
+            _recent_winners.append(best_lang)
+    if best_lang == default_lang and lang in OCR_ROUTE_LANGS:
+        best_lang = lang
+    return best_lang, {**meta, "script": script, "ocr_lang": best_lang, "route_probed": probes}
@@ -0,0 +1,292 @@
+# app/gemini/ocr_worker.py
+# ============================================================
+# Dedicated OCR worker processes (models preloaded once)
+#
+#   python -m app.gemini.ocr_worker __warmup__ [log_file]
+#   python -m app.gemini.ocr_worker <image> [<image> ...]
+# ============================================================
+#
+# OCR is CPU bound and the GIL serialises it across the invoice
+# threads, so pages are shipped to a pool of long-lived spawn()ed
+# processes over a multiprocessing queue. Each process loads
+# PaddleOCR (and optionally TrOCR) once in its initializer.
+#
+# A worker runs one task at a time, so recognition batching across
+# invoices has to happen before the pages leave this process: the
+# PageBatcher pools pages from concurrent invoice threads into one
+# _worker_ocr_batch call per process. A page waits (at most
+# OCR_WORKER_BATCH_WAIT_MS) only while another invoice thread is still
+# preparing one – a lone caller is dispatched at once.
+#
+# NOTE: this module must not import ocr_engine at import time –
+# ocr_engine imports us to dispatch work.
+
+import os
+import sys
+import time
+import atexit
+import threading
+import multiprocessing as mp
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+OCR_WORKER_PROCESSES = int(os.getenv("OCR_WORKER_PROCESSES", "2"))
+OCR_WORKER_TROCR = os.getenv("OCR_WORKER_TROCR", "0") == "1"
+OCR_WORKER_TIMEOUT = float(os.getenv("OCR_WORKER_TIMEOUT", "300"))
+OCR_WORKER_BATCH_PAGES = int(os.getenv("OCR_WORKER_BATCH_PAGES", "8"))
+OCR_WORKER_BATCH_WAIT_MS = float(os.getenv("OCR_WORKER_BATCH_WAIT_MS", "50"))
+
+_executor = None
+_executor_lock = threading.Lock()
+_IN_WORKER = False
+
+
+def enabled() -> bool:
+    return OCR_WORKER_PROCESSES > 0 and not _IN_WORKER
+
+
+# ============================================================
+# WORKER SIDE
+# ============================================================
+
+def _worker_init(preload_trocr: bool):
+    global _IN_WORKER
+    _IN_WORKER = True
+
+    # One engine per process – parallelism comes from the processes.
+    os.environ["OCR_POOL_SIZE"] = "1"
+
+    from app.gemini import ocr_engine
+    ocr_engine.warmup(trocr=preload_trocr)
+
+
+def _worker_ocr_batch(images, handwriting=True, text_gate=True):
+    from app.gemini.ocr_batch import extract_text_batch
+    return extract_text_batch(images, handwriting=handwriting, text_gate=text_gate)
+
+
+def _worker_detect(img):
+    from app.gemini.ocr_batch import detect_text_regions
+    return detect_text_regions(img)
+
+
+# ============================================================
+# CLIENT SIDE
+# ============================================================
+
+def get_pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            print(f"🧵 Starting {OCR_WORKER_PROCESSES} OCR worker processes")
+            _executor = ProcessPoolExecutor(
+                max_workers=OCR_WORKER_PROCESSES,
+                mp_context=mp.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(OCR_WORKER_TROCR,),
+            )
+        return _executor
+
+
+def submit(func, *args):
+    """Submit any picklable top-level function to the OCR processes."""
+    return get_pool().submit(func, *args)
+
+
+class PageBatcher:
+    """
+    Pools pages from concurrent callers into shared _worker_ocr_batch
+    calls (one chunk per worker process). Callers register with
+    caller() while they may still send pages; a batch waits for more
+    only while a registered caller has nothing queued or in flight.
+    """
+
+    def __init__(self, max_pages=OCR_WORKER_BATCH_PAGES, max_wait_ms=OCR_WORKER_BATCH_WAIT_MS):
+        self.max_pages = max(1, int(max_pages))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+
+        self._cond = threading.Condition()
+        self._pending = []    # (img, handwriting, text_gate, future)
+        self._callers = 0
+        self._waiting = 0     # callers blocked in run()
+        self._thread = None
+
+    @contextmanager
+    def caller(self):
+        with self._cond:
+            self._callers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._callers -= 1
+                self._cond.notify_all()
+
+    def run(self, images, handwriting=True, text_gate=True, timeout=None) -> list:
+        futures = [Future() for _ in images]
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="ocr-page-batcher", daemon=True)
+                self._thread.start()
+            self._pending.extend((img, handwriting, text_gate, f) for img, f in zip(images, futures))
+            self._waiting += 1
+            self._cond.notify_all()
+
+        try:
+            return [future.result(timeout=timeout) for future in futures]
+        finally:
+            with self._cond:
+                self._waiting -= 1
+                self._cond.notify_all()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_pages and self._callers > self._waiting:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_pages]
+                self._pending = self._pending[self.max_pages:]
+
+            self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        groups = {}
+        for item in batch:
+            groups.setdefault((item[1], item[2]), []).append(item)
+
+        for (handwriting, text_gate), items in groups.items():
+            size = -(-len(items) // OCR_WORKER_PROCESSES)
+            for start in range(0, len(items), size):
+                chunk = items[start:start + size]
+                try:
+                    future = submit(_worker_ocr_batch, [item[0] for item in chunk], handwriting, text_gate)
+                except Exception as e:
+                    for item in chunk:
+                        item[3].set_exception(e)
+                    continue
+                future.add_done_callback(lambda f, chunk=chunk: _resolve(chunk, f))
+
+
+def _resolve(chunk, future):
+    try:
+        results = future.result()
+    except Exception as e:   # includes CancelledError after shutdown()
+        for item in chunk:
+            item[3].set_exception(e)
+        return
+    for item, result in zip(chunk, results):
+        item[3].set_result(result)
+
+
+_batcher = None
+
+
+def get_page_batcher() -> PageBatcher:
+    global _batcher
+    with _executor_lock:
+        if _batcher is None:
+            _batcher = PageBatcher()
+        return _batcher
+
+
+def caller():
+    """Context for one invoice's OCR – lets the PageBatcher know more pages may follow."""
+    return get_page_batcher().caller() if enabled() else nullcontext()
+
+
+def run(img_np, timeout=None):
+    """OCR one preprocessed page in a worker process and return its OcrResult."""
+    return run_batch([img_np], timeout=timeout)[0]
+
+
+def run_detect(img, timeout=None):
+    """Detection-only pass in a worker → {"text_regions", "text_area"}."""
+    timeout = OCR_WORKER_TIMEOUT if timeout is None else timeout
+    try:
+        return submit(_worker_detect, img).result(timeout=timeout)
+    except BrokenProcessPool:
+        print("⚠️ OCR worker pool crashed – restarting")
+        shutdown()
+        raise
+
+
+def run_batch(images, timeout=None, handwriting=True, text_gate=True):
+    """
+    OCR many pages across all worker processes, pooled with the pages
+    of any other invoice being OCR'd at the same time.
+    """
+    if not images:
+        return []
+
+    timeout = OCR_WORKER_TIMEOUT if timeout is None else timeout
+    try:
+        return get_page_batcher().run(images, handwriting, text_gate, timeout=timeout)
+    except BrokenProcessPool:
+        print("⚠️ OCR worker pool crashed – restarting")
+        shutdown()
+        raise
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+atexit.register(shutdown)
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def _warmup(log_path=None):
+    from app.gemini import ocr_engine
+
+    ocr_engine.warmup(trocr=OCR_WORKER_TROCR)
+
+    if log_path and log_path not in ("NUL", os.devnull):
+        with open(log_path, "w", encoding="utf-8") as fh:
+            fh.write("OCR models ready\n")
+    return 0
+
+
+def _ocr_files(paths):
+    from app.gemini.ocr_engine import decode_image, ocr_page, preprocess
+
+    for path in paths:
+        try:
+            with open(path, "rb") as fh:
+                img = decode_image(fh.read())
+        except Exception as e:
+            print(f"❌ Cannot read image {path}: {e}")
+            continue
+
+        result = ocr_page(preprocess(img))
+        print(f"========== {path} ==========")
+        for line, conf in zip(result.lines, result.confidences):
+            print(f"{conf:.2f}  {line}")
+    return 0
+
+
+def main(argv):
+    if not argv:
+        print("usage: python -m app.gemini.ocr_worker __warmup__ [log_file] | <image> ...")
+        return 2
+
+    if argv[0] == "__warmup__":
+        return _warmup(argv[1] if len(argv) > 1 else None)
+
+    return _ocr_files(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
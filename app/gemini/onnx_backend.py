@@ -0,0 +1,91 @@
+# app/gemini/onnx_backend.py
+# ============================================================
+# ONNX Runtime backend for the PaddleOCR det / cls / rec models
+# ============================================================
+#
+# Export the Paddle inference models once (paddle2onnx), e.g.:
+#
+#   paddle2onnx --model_dir ~/.paddleocr/whl/det/ch/ch_PP-OCRv4_det_infer \
+#       --model_filename inference.pdmodel --params_filename inference.pdiparams \
+#       --save_file models/onnx/det.onnx --opset_version 11
+#
+# and the same for cls → cls.onnx, rec → rec.onnx in OCR_ONNX_DIR.
+#
+# PaddleOCR(use_onnx=True) already knows how to pre/post-process for
+# ONNX models, but builds bare InferenceSessions with default threading.
+# We swap in sessions with explicit intra-/inter-op thread counts and a
+# graph optimisation level so each pooled engine uses a known number of
+# cores.
+
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
+OCR_ONNX_DIR = Path(os.getenv("OCR_ONNX_DIR", str(BASE_DIR / "models" / "onnx")))
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "1"))
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "1"))
+ORT_GRAPH_OPT_LEVEL = os.getenv("ORT_GRAPH_OPT_LEVEL", "all")
+
+
+def _graph_opt_level(ort, name: str):
+    levels = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    if name not in levels:
+        raise ValueError(f"ORT_GRAPH_OPT_LEVEL must be one of {sorted(levels)}")
+    return levels[name]
+
+
+def create_session(model_path, intra_op_threads=ORT_INTRA_OP_THREADS,
+                   inter_op_threads=ORT_INTER_OP_THREADS, graph_opt_level=ORT_GRAPH_OPT_LEVEL):
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise RuntimeError("OCR_BACKEND=onnx requires onnxruntime (pip install onnxruntime)") from e
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = _graph_opt_level(ort, graph_opt_level)
+
+    return ort.InferenceSession(
+        str(model_path),
+        sess_options=options,
+        providers=["CPUExecutionProvider"],
+    )
+
+
+def model_paths(onnx_dir=OCR_ONNX_DIR) -> dict:
+    paths = {name: Path(onnx_dir) / f"{name}.onnx" for name in ("det", "cls", "rec")}
+    missing = [str(p) for p in paths.values() if not p.exists()]
+    if missing:
+        raise RuntimeError(f"ONNX OCR models not found: {', '.join(missing)}")
+    return paths
+
+
+def init_onnx_paddle_ocr(paddle_cls, **kwargs):
+    """Build a PaddleOCR engine whose det / cls / rec run on ONNX Runtime."""
+    paths = model_paths()
+
+    ocr = paddle_cls(
+        use_onnx=True,
+        det_model_dir=str(paths["det"]),
+        cls_model_dir=str(paths["cls"]),
+        rec_model_dir=str(paths["rec"]),
+        **kwargs,
+    )
+
+    stages = [(ocr.text_detector, "det"), (ocr.text_recognizer, "rec")]
+    if getattr(ocr, "use_angle_cls", False):
+        stages.append((ocr.text_classifier, "cls"))
+
+    for stage, name in stages:
+        stage.predictor = create_session(paths[name])
+
+    return ocr
+
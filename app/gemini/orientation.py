@@ -0,0 +1,105 @@
+# app/gemini/orientation.py
+# ============================================================
+# Page-level orientation / skew check on detection output
+# ============================================================
+#
+# Most scans are upright, so running the angle classifier on every text
+# box is wasted work. One cheap pass over the detection boxes decides
+# whether a page needs per-box classification:
+#
+#   1. geometry  – long-edge angle of every box → page skew and spread;
+#                  a majority of tall boxes means a 90°/270° page.
+#   2. sample    – the classifier sees only the few largest line crops;
+#                  any confident "180" means an upside-down page.
+#
+# Pages that are rotated, mixed or fail the sample get full per-box
+# classification; upright pages skip it.
+
+import os
+import threading
+
+import numpy as np
+
+OCR_ORIENT_CHECK = os.getenv("OCR_ORIENT_CHECK", "1") == "1"
+OCR_ORIENT_SAMPLE = int(os.getenv("OCR_ORIENT_SAMPLE", "5"))
+OCR_ORIENT_MAX_SPREAD = float(os.getenv("OCR_ORIENT_MAX_SPREAD", "8"))
+OCR_ORIENT_CLS_THRESH = float(os.getenv("OCR_ORIENT_CLS_THRESH", "0.9"))
+
+_stats = {"pages": 0, "cls_skipped": 0, "cls_run": 0}
+_stats_lock = threading.Lock()
+
+
+def box_geometry(boxes) -> tuple:
+    """
+    Per-box (skew, is_tall, area) for quadrilateral detection boxes.
+    Skew is the long edge's angle to the nearest axis, in [-45, 45) degrees.
+    """
+    pts = np.asarray(boxes, dtype=np.float32).reshape(-1, 4, 2)
+    top = pts[:, 1] - pts[:, 0]
+    side = pts[:, 3] - pts[:, 0]
+
+    width = np.linalg.norm(top, axis=1)
+    height = np.linalg.norm(side, axis=1)
+    long_edge = np.where((width >= height)[:, None], top, side)
+
+    angles = np.degrees(np.arctan2(long_edge[:, 1], long_edge[:, 0]))
+    skew = (angles + 45) % 90 - 45
+
+    return skew, height > width * 1.5, width * height
+
+
+def assess_page(boxes) -> dict:
+    """Geometry-only verdict: skew, spread and whether the page looks rotated/mixed."""
+    if not len(boxes):
+        return {"skew": 0.0, "spread": 0.0, "rotated": False, "mixed": False}
+
+    angles, tall, _ = box_geometry(boxes)
+    spread = float(np.std(angles)) if len(angles) > 1 else 0.0
+    tall_ratio = float(tall.mean())
+
+    return {
+        "skew": round(float(np.median(angles)), 2),
+        "spread": round(spread, 2),
+        "rotated": tall_ratio > 0.5,
+        "mixed": spread > OCR_ORIENT_MAX_SPREAD or 0.2 < tall_ratio <= 0.5,
+    }
+
+
+def sample_flipped(classifier, boxes, crops) -> bool:
+    """Classify only the largest few line crops; True if any is confidently 180°."""
+    if not crops:
+        return False
+
+    _, _, areas = box_geometry(boxes)
+    largest = np.argsort(areas)[::-1][:OCR_ORIENT_SAMPLE]
+    _, cls_res, _ = classifier([crops[i] for i in largest])
+
+    return any(label == "180" and score >= OCR_ORIENT_CLS_THRESH for label, score in cls_res)
+
+
+def needs_angle_cls(ocr, boxes, crops) -> tuple:
+    """
+    Decide whether per-box angle classification should run for a page.
+    Returns (run_cls, info) where info goes into the page's stage meta.
+    """
+    if not getattr(ocr, "use_angle_cls", False):
+        return False, {"angle_cls": "disabled"}
+    if not OCR_ORIENT_CHECK:
+        return True, {"angle_cls": "run"}
+
+    info = assess_page(boxes)
+    run_cls = info["rotated"] or info["mixed"] or sample_flipped(ocr.text_classifier, boxes, crops)
+    info["angle_cls"] = "run" if run_cls else "skipped"
+
+    with _stats_lock:
+        _stats["pages"] += 1
+        _stats["cls_run" if run_cls else "cls_skipped"] += 1
+
+    return run_cls, info
+
+
+def orientation_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["skip_rate"] = round(stats["cls_skipped"] / stats["pages"], 4) if stats["pages"] else 0.0
+    return stats
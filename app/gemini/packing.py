@@ -0,0 +1,250 @@
+# app/gemini/packing.py
+# ============================================================
+# Packed Gemini requests: several invoices per generate_content
+# ============================================================
+#
+# The rules block of build_invoice_prompt is far larger than a typical
+# OCR text, so one request per invoice mostly pays for the same prompt
+# again and again. Invoice threads submit their OCR text here; up to
+# GEMINI_PACK_MAX_DOCS texts (within GEMINI_PACK_TOKEN_BUDGET estimated
+# input tokens, waiting at most GEMINI_PACK_MAX_WAIT_MS for company)
+# go out as one build_packed_invoice_prompt request. The answer is a
+# JSON array keyed by document ID.
+#
+# Each packed answer is cleaned (typed, defaults filled) like a single
+# answer, then checked; a document missing from the answer, malformed,
+# or answered with defaults only is split out and retried on its own; a
+# failed pack request retries every document on its own.
+#
+# Nothing here blocks on Gemini: requests are Futures from the LLM
+# dispatcher and answers are handled when they resolve, so how many
+# calls are in flight is the dispatcher's decision alone. Those Futures
+# resolve on the dispatcher's event loop; answer parsing, cleaning and
+# retries are handed to a small callback pool (GEMINI_CALLBACK_THREADS)
+# so they never block the loop.
+#
+# Each text is submitted with the ExtractionSchema compiled when it
+# arrived; a pack only holds texts sharing one schema and keeps it for
+# its retries, so editing a CustomExtractionField mid-batch (which
+# clears the compiled schema) never reaches the ORM from a callback.
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from app.gemini.builder import build_packed_invoice_prompt
+from app.gemini.lenient_json import TruncatedJSON, loads_lenient
+
+GEMINI_PACK_MAX_DOCS = int(os.getenv("GEMINI_PACK_MAX_DOCS", "6"))
+GEMINI_PACK_TOKEN_BUDGET = int(os.getenv("GEMINI_PACK_TOKEN_BUDGET", "24000"))
+GEMINI_PACK_MAX_WAIT_MS = float(os.getenv("GEMINI_PACK_MAX_WAIT_MS", "1500"))
+GEMINI_CALLBACK_THREADS = int(os.getenv("GEMINI_CALLBACK_THREADS", "4"))
+
+_callback_threads = ThreadPoolExecutor(max_workers=GEMINI_CALLBACK_THREADS, thread_name_prefix="gemini-callback")
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 Latin chars per token; CJK / Indic chars are roughly one each."""
+    non_ascii = sum(1 for ch in text if not ch.isascii())
+    return (len(text) - non_ascii) // 4 + non_ascii + 1
+
+
+def then(future: Future, func, executor=None) -> Future:
+    """
+    Future of func(future) once `future` is done – success or failure.
+    func runs on `executor` (default: the callback pool), never on the
+    thread that resolved `future`. If func returns a Future (a follow-up
+    request), the result is that Future's outcome.
+    """
+    out = Future()
+
+    def run(source):
+        try:
+            value = func(source)
+        except Exception as e:
+            out.set_exception(e)
+            return
+        if isinstance(value, Future):
+            value.add_done_callback(lambda f: _copy_outcome(f, out))
+        else:
+            out.set_result(value)
+
+    future.add_done_callback(lambda source: (executor or _callback_threads).submit(run, source))
+    return out
+
+
+def chain(future: Future, func, executor=None) -> Future:
+    """Future of func(future.result()); see then()."""
+    return then(future, lambda source: func(source.result()), executor)
+
+
+def resolved(value) -> Future:
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _failed(error) -> Future:
+    future = Future()
+    future.set_exception(error)
+    return future
+
+
+def parse_packed_response(output: str, schema) -> dict:
+    """
+    Model output → {document_id: fields dict}. Accepts an array or an
+    id-keyed object. When the output was cut off, only documents whose
+    fields were read in full are kept; the rest are retried.
+    """
+    truncated = False
+    try:
+        parsed = loads_lenient(output)
+    except TruncatedJSON as e:
+        parsed, truncated = e.partial, True
+
+    if isinstance(parsed, dict):
+        results = {str(k): v for k, v in parsed.items()}
+    else:
+        results = {
+            str(item["document_id"]): item.get("fields")
+            for item in parsed
+            if isinstance(item, dict) and "document_id" in item
+        }
+
+    if truncated:
+        results = {doc_id: fields for doc_id, fields in results.items() if schema.is_complete(fields)}
+    return results
+
+
+class GeminiPacker:
+    """
+    Collects OCR texts from any number of invoice threads and extracts
+    them in packed requests. Each caller gets a Future resolving to its
+    own fields dict.
+
+    `generate(prompt, schema) -> Future[str]` calls the model,
+    `single(text, schema) -> Future[dict]` is the one-document path used
+    for retries, and `accept(dict) -> bool` decides whether a cleaned
+    packed answer is kept.
+    """
+
+    def __init__(self, generate, single, accept, max_docs=GEMINI_PACK_MAX_DOCS,
+                 token_budget=GEMINI_PACK_TOKEN_BUDGET, max_wait_ms=GEMINI_PACK_MAX_WAIT_MS):
+        self.generate = generate
+        self.single = single
+        self.accept = accept
+        self.max_docs = max(1, int(max_docs))
+        self.token_budget = token_budget
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "packed_docs": 0, "split_retries": 0}
+
+    def submit(self, text: str, schema) -> Future:
+        """`schema` is the ExtractionSchema to extract `text` with."""
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((text, estimate_tokens(text), future, schema))
+        return future
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="gemini-packer", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        carry = None
+        while True:
+            first = carry or self._queue.get()
+            carry = None
+            pending = [first]
+            tokens = first[1]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(pending) < self.max_docs:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if tokens + item[1] > self.token_budget or item[3] is not first[3]:
+                    carry = item   # opens the next pack
+                    break
+                pending.append(item)
+                tokens += item[1]
+
+            self._run(pending)
+
+    def _run_single(self, text, schema, future):
+        try:
+            request = self.single(text, schema)
+        except Exception as e:
+            request = _failed(e)
+        request.add_done_callback(lambda f: _copy_outcome(f, future))
+
+    def _run(self, pending):
+        schema = pending[0][3]
+        if len(pending) == 1:
+            text, _, future, _ = pending[0]
+            self._run_single(text, schema, future)
+            return
+
+        documents = [(f"DOC-{i}", text) for i, (text, *_) in enumerate(pending, start=1)]
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["packed_docs"] += len(pending)
+
+        try:
+            request = self.generate(build_packed_invoice_prompt(documents, schema=schema), schema)
+        except Exception as e:
+            request = _failed(e)
+        then(request, lambda f: self._answer(documents, pending, schema, f))
+
+    def _answer(self, documents, pending, schema, request):
+        try:
+            answers = parse_packed_response(request.result(), schema)
+        except Exception as e:
+            print(f"⚠️ Packed Gemini request failed ({len(pending)} docs), retrying one by one: {e}")
+            answers = {}
+
+        for (doc_id, _), (text, _, future, _) in zip(documents, pending):
+            fields = answers.get(doc_id)
+            try:
+                fields = schema.clean(fields) if isinstance(fields, dict) else None
+            except Exception:
+                fields = None
+
+            if fields is not None and self.accept(fields):
+                future.set_result(fields)
+                continue
+
+            with self._lock:
+                self.stats["split_retries"] += 1
+            self._run_single(text, schema, future)
+
+
+def _copy_outcome(source: Future, target: Future):
+    error = source.exception()
+    if error is not None:
+        target.set_exception(error)
+    else:
+        target.set_result(source.result())
+
+
+_packer = None
+_packer_lock = threading.Lock()
+
+
+def get_packer(generate, single, accept) -> GeminiPacker:
+    global _packer
+    with _packer_lock:
+        if _packer is None:
+            _packer = GeminiPacker(generate, single, accept)
+        return _packer
@@ -0,0 +1,173 @@
+# app/gemini/pdf_reader.py
+# ============================================================
+# PDF invoices: text-layer fast path, lazy rasterization
+# and page-parallel OCR for scanned pages
+# ============================================================
+
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+PDF_RENDER_DPI = int(os.getenv("PDF_RENDER_DPI", "200"))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "10"))
+PDF_PAGE_WORKERS = int(os.getenv("PDF_PAGE_WORKERS", "4"))
+PDF_TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", "30"))
+# A page mostly covered by images is a scan; its text layer is trusted
+# only if it spans a real share of the page (not a stamp / Bates number)
+PDF_SCAN_IMAGE_COVERAGE = float(os.getenv("PDF_SCAN_IMAGE_COVERAGE", "0.5"))
+PDF_SCAN_MIN_TEXT_AREA = float(os.getenv("PDF_SCAN_MIN_TEXT_AREA", "0.05"))
+
+PAGE_SOURCE_TEXT = "text_layer"
+PAGE_SOURCE_OCR = "ocr"
+
+
+def is_pdf(data: bytes) -> bool:
+    # The spec allows junk before the header within the first 1 KB
+    return b"%PDF-" in data[:1024]
+
+
+def open_pdf(data: bytes):
+    try:
+        import fitz  # PyMuPDF
+    except ImportError as e:
+        raise RuntimeError("PDF support requires PyMuPDF (pip install PyMuPDF)") from e
+
+    return fitz.open(stream=data, filetype="pdf")
+
+
+def render_page(page, dpi: int = PDF_RENDER_DPI) -> np.ndarray:
+    """Rasterize one page straight to a grayscale array at the requested DPI."""
+    import fitz
+
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+
+# ============================================================
+# EMBEDDED TEXT LAYER (digital PDFs – no OCR needed)
+# ============================================================
+
+def page_text_lines(page) -> list:
+    """
+    Rebuild reading order from the page's word boxes:
+    words are clustered into visual lines by vertical centre and each
+    line is read left → right. Returns [(text, [x0, y0, x1, y1]), ...].
+    """
+    words = page.get_text("words")
+    if not words:
+        return []
+
+    words = sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+    lines = []
+
+    for x0, y0, x1, y1, word, *_ in words:
+        centre, height = (y0 + y1) / 2, y1 - y0
+        current = lines[-1] if lines else None
+
+        if current and abs(centre - current["centre"]) <= max(height, current["height"]) * 0.5:
+            current["words"].append((x0, word))
+            current["bbox"] = [
+                min(current["bbox"][0], x0), min(current["bbox"][1], y0),
+                max(current["bbox"][2], x1), max(current["bbox"][3], y1),
+            ]
+        else:
+            lines.append({
+                "centre": centre,
+                "height": height,
+                "words": [(x0, word)],
+                "bbox": [x0, y0, x1, y1],
+            })
+
+    return [
+        (" ".join(word for _, word in sorted(line["words"])), line["bbox"])
+        for line in lines
+    ]
+
+
+def image_coverage(page) -> float:
+    """Share of the page area covered by raster images (overlaps counted once per image)."""
+    page_area = page.rect.width * page.rect.height
+    if page_area <= 0:
+        return 0.0
+
+    covered = 0.0
+    for info in page.get_image_info():
+        x0, y0, x1, y1 = info["bbox"]
+        w = min(x1, page.rect.x1) - max(x0, page.rect.x0)
+        h = min(y1, page.rect.y1) - max(y0, page.rect.y0)
+        if w > 0 and h > 0:
+            covered += w * h
+    return min(1.0, covered / page_area)
+
+
+def text_area_ratio(lines: list, page) -> float:
+    page_area = page.rect.width * page.rect.height
+    area = sum(max(0, x1 - x0) * max(0, y1 - y0) for _, (x0, y0, x1, y1) in lines)
+    return area / page_area if page_area > 0 else 0.0
+
+
+def has_usable_text(lines: list, page=None, min_chars: int = PDF_TEXT_MIN_CHARS) -> bool:
+    text = "".join(t for t, _ in lines)
+    if len(text.strip()) < min_chars:
+        return False
+
+    # Broken font encodings come out as U+FFFD / "(cid:NN)" garbage
+    garbage = text.count("\ufffd") + text.count("(cid:") * 6
+    if garbage / max(len(text), 1) >= 0.1:
+        return False
+
+    # Scanned page with a DMS stamp / header overlay: OCR the scan instead
+    if page is not None and image_coverage(page) >= PDF_SCAN_IMAGE_COVERAGE:
+        return text_area_ratio(lines, page) >= PDF_SCAN_MIN_TEXT_AREA
+    return True
+
+
+def iter_pdf_pages(data: bytes, ocr_func, text_builder, dpi: int = PDF_RENDER_DPI,
+                   max_pages: int = PDF_MAX_PAGES, workers: int = PDF_PAGE_WORKERS, info=None):
+    """
+    Read a PDF page-parallel and stream (page_no, OcrResult, source)
+    back in page order.
+
+    Pages with a usable embedded text layer are read directly via
+    `text_builder(lines, (width, height))` – page size in points –
+    (milliseconds). Only scanned pages are
+    rasterized – lazily, on the calling thread, because PyMuPDF documents
+    are not thread safe – and sent to `ocr_func`, with at most `workers`
+    pages in flight so memory stays bounded.
+
+    If `info` (a dict) is given, it receives "page_count" and
+    "pages_skipped" (pages beyond `max_pages` that were not read).
+    """
+    with open_pdf(data) as doc:
+        skipped = max(0, doc.page_count - max_pages)
+        if info is not None:
+            info.update(page_count=doc.page_count, pages_skipped=skipped)
+        if skipped:
+            print(f"⚠️ PDF has {doc.page_count} pages – capped at {max_pages}")
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            in_flight = deque()
+
+            for index in range(min(doc.page_count, max_pages)):
+                page = doc.load_page(index)
+                lines = page_text_lines(page)
+
+                if has_usable_text(lines, page):
+                    future = Future()
+                    future.set_result(text_builder(lines, (page.rect.width, page.rect.height)))
+                    source = PAGE_SOURCE_TEXT
+                else:
+                    future = executor.submit(ocr_func, render_page(page, dpi))
+                    source = PAGE_SOURCE_OCR
+
+                in_flight.append((index + 1, future, source))
+
+                if len(in_flight) >= workers:
+                    page_no, done, done_source = in_flight.popleft()
+                    yield page_no, done.result(), done_source
+
+            while in_flight:
+                page_no, done, done_source = in_flight.popleft()
+                yield page_no, done.result(), done_source
@@ -0,0 +1,97 @@
+# app/gemini/test_lenient_json.py
+# Pure parser – plain unittest, no database:
+#   python -m pytest app/gemini/test_lenient_json.py
+#   python manage.py test app.gemini.test_lenient_json
+
+import unittest
+
+from app.gemini.lenient_json import TruncatedJSON, loads_lenient
+
+
+class StrictInputTests(unittest.TestCase):
+
+    def test_valid_json(self):
+        self.assertEqual(loads_lenient('{"a": 1, "b": [true, null]}'), {"a": 1, "b": [True, None]})
+
+    def test_fenced_with_surrounding_text(self):
+        self.assertEqual(loads_lenient('Here you go:\n```json\n{"a": 1}\n```\nDone.'), {"a": 1})
+
+    def test_no_json(self):
+        with self.assertRaises(ValueError):
+            loads_lenient("Sorry, I cannot help with that.")
+
+
+class LenientInputTests(unittest.TestCase):
+
+    def test_comments_and_trailing_commas(self):
+        text = '{\n  // header\n  "a": 1, /* inline */\n  "b": [1, 2,],\n}'
+        self.assertEqual(loads_lenient(text), {"a": 1, "b": [1, 2]})
+
+    def test_single_quotes_unquoted_keys_python_literals(self):
+        self.assertEqual(
+            loads_lenient("{'a': True, b: None, c: false}"),
+            {"a": True, "b": None, "c": False},
+        )
+
+    def test_numbers(self):
+        self.assertEqual(
+            loads_lenient("{a: -1.5e3, b: .5, c: 7, d: -2}"),
+            {"a": -1500.0, "b": 0.5, "c": 7, "d": -2},
+        )
+
+    def test_bare_value_starting_with_digits_stays_text(self):
+        self.assertEqual(
+            loads_lenient("{name: 123 Main St, total: 5}"),
+            {"name": "123 Main St", "total": 5},
+        )
+
+    def test_bare_date(self):
+        self.assertEqual(loads_lenient('{"d": 2024-01-05, "x": 1}'), {"d": "2024-01-05", "x": 1})
+
+    def test_comment_after_bare_value(self):
+        self.assertEqual(loads_lenient("{total: 5 // incl. VAT\n, x: 1}"), {"total": 5, "x": 1})
+
+    def test_hash_is_not_a_comment(self):
+        self.assertEqual(
+            loads_lenient('{"note": Total # 5, "x": 1}'),
+            {"note": "Total # 5", "x": 1},
+        )
+        self.assertEqual(loads_lenient("{ref: Invoice #123, n: 2}"), {"ref": "Invoice #123", "n": 2})
+
+    def test_escapes(self):
+        self.assertEqual(loads_lenient(r"{'a': 'it\'s é\n'}"), {"a": "it's é\n"})
+
+    def test_malformed_unicode_escape(self):
+        self.assertEqual(loads_lenient(r"{'a': 'x\uZZZZ', b: 1}"), {"a": "xuZZZZ", "b": 1})
+
+
+class TruncationTests(unittest.TestCase):
+
+    def assertTruncated(self, text, partial):
+        with self.assertRaises(TruncatedJSON) as ctx:
+            loads_lenient(text)
+        self.assertEqual(ctx.exception.partial, partial)
+
+    def test_cut_inside_number(self):
+        self.assertTruncated('{"a": 1, "b": 12', {"a": 1})
+
+    def test_cut_inside_string(self):
+        self.assertTruncated('{"a": 1, "b": "tru', {"a": 1})
+
+    def test_cut_inside_unicode_escape(self):
+        self.assertTruncated(r'{"a": 1, "b": "\u00', {"a": 1})
+
+    def test_cut_after_value(self):
+        self.assertTruncated('{"a": 1, "b": 2', {"a": 1})
+        self.assertTruncated('{"a": 1, "b": "x"', {"a": 1, "b": "x"})
+
+    def test_cut_inside_array(self):
+        self.assertTruncated('[{"id": 1}, {"id": 2}, {"id"', [{"id": 1}, {"id": 2}, {}])
+
+    def test_truncation_is_a_value_error(self):
+        with self.assertRaises(ValueError):
+            loads_lenient('{"a": "unterminated')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+# app/gemini/tiling.py
+# ============================================================
+# Tiled OCR for very large / dense pages
+# ============================================================
+#
+# Shrinking an A3 scan or a 6000 px thermal receipt to 2000 px blurs
+# small print. Instead, oversized pages are cut into overlapping
+# full-width strips at native resolution, each strip is OCR'd as its
+# own unit of work (in parallel through the OCR pool), and the lines
+# are merged back into page coordinates.
+#
+# Only pages that really lose detail are tiled:
+#
+#   • long receipts – long side > OCR_MAX_DIM and aspect ratio
+#     >= OCR_TILE_MIN_ASPECT (shrinking leaves them a few hundred px wide)
+#   • very large pages – long side > OCR_TILE_TRIGGER (well above
+#     2 × OCR_MAX_DIM, e.g. A3 at 300 dpi)
+#
+# A 4032×3024 phone photo is neither: it keeps the DCT-reduced decode
+# and the resolution ladder (one pass at <= 2000 px).
+#
+# Strips span the full width so seams never cut a text line lengthwise.
+# Seam duplicates are resolved by ownership: a line belongs to the strip
+# whose core region (the strip minus half the overlap on each inner
+# edge) contains its vertical centre; remaining overlaps are dropped by
+# box IoU, keeping the more confident line.
+
+import os
+
+import numpy as np
+
+from app.gemini.image_prep import OCR_MAX_DIM
+
+OCR_TILE_MODE = os.getenv("OCR_TILE_MODE", "1") == "1"
+OCR_TILE_TRIGGER = int(os.getenv("OCR_TILE_TRIGGER", "4500"))
+OCR_TILE_MIN_ASPECT = float(os.getenv("OCR_TILE_MIN_ASPECT", "3.0"))
+OCR_TILE_SIZE = int(os.getenv("OCR_TILE_SIZE", "1600"))
+OCR_TILE_OVERLAP = int(os.getenv("OCR_TILE_OVERLAP", "200"))
+OCR_TILE_MAX_DIM = int(os.getenv("OCR_TILE_MAX_DIM", "6000"))
+OCR_TILE_DEDUPE_IOU = 0.5
+
+
+def should_tile(width: int, height: int) -> bool:
+    """
+    Decided from the stored size (image header or rendered page), so the
+    decode size can follow: tiled pages up to OCR_TILE_MAX_DIM, all
+    others at OCR_MAX_DIM.
+    """
+    long_side, short_side = max(width, height), max(1, min(width, height))
+    if not OCR_TILE_MODE or long_side <= OCR_MAX_DIM:
+        return False
+    return long_side > OCR_TILE_TRIGGER or long_side / short_side >= OCR_TILE_MIN_ASPECT
+
+
+def strip_origins(length: int, size: int = OCR_TILE_SIZE, overlap: int = OCR_TILE_OVERLAP) -> list:
+    if length <= size:
+        return [0]
+
+    step = max(1, size - overlap)
+    origins = list(range(0, length - size, step))
+    origins.append(length - size)
+    return origins
+
+
+def split_strips(img: np.ndarray, size: int = OCR_TILE_SIZE, overlap: int = OCR_TILE_OVERLAP) -> list:
+    """[(y0, y1, strip_view), ...] – views, no pixel copies."""
+    height = img.shape[0]
+    return [
+        (y0, min(y0 + size, height), img[y0:y0 + size])
+        for y0 in strip_origins(height, size, overlap)
+    ]
+
+
+def _core_bounds(strips: list) -> list:
+    """Vertical core region owned by each strip (half the overlap each side)."""
+    bounds = []
+    for i, (y0, y1, _) in enumerate(strips):
+        top = y0 if i == 0 else (y0 + strips[i - 1][1]) / 2
+        bottom = y1 if i == len(strips) - 1 else (y1 + strips[i + 1][0]) / 2
+        bounds.append((top, bottom))
+    return bounds
+
+
+def _box_iou(a, b) -> float:
+    ax0, ay0, ax1, ay1 = a
+    bx0, by0, bx1, by1 = b
+    iw = max(0.0, min(ax1, bx1) - max(ax0, bx0))
+    ih = max(0.0, min(ay1, by1) - max(ay0, by0))
+    inter = iw * ih
+    union = (ax1 - ax0) * (ay1 - ay0) + (bx1 - bx0) * (by1 - by0) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def merge_strip_lines(strips: list, strip_lines: list) -> list:
+    """
+    strip_lines[i] holds (box, text, conf) in strip-local coordinates.
+    Returns de-duplicated (box, text, conf) in page coordinates, in
+    reading order.
+    """
+    merged = []
+
+    for (y0, _, _), (top, bottom), lines in zip(strips, _core_bounds(strips), strip_lines):
+        for box, text, conf in lines:
+            page_box = [[float(x), float(y) + y0] for x, y in box]
+            centre = sum(y for _, y in page_box) / 4
+            if top <= centre < bottom or (centre == bottom == strips[-1][1]):
+                merged.append((page_box, text, conf))
+
+    # Safety net for lines taller than half the overlap
+    kept = []
+    bboxes = []
+    for box, text, conf in sorted(merged, key=lambda line: -line[2]):
+        xs, ys = [x for x, _ in box], [y for _, y in box]
+        bbox = (min(xs), min(ys), max(xs), max(ys))
+        if any(_box_iou(bbox, other) > OCR_TILE_DEDUPE_IOU for other in bboxes):
+            continue
+        kept.append((box, text, conf))
+        bboxes.append(bbox)
+
+    return sorted(kept, key=lambda line: (round(line[0][0][1] / 10), line[0][0][0]))
@@ -0,0 +1,103 @@
+# app/management/commands/calibrate_near_duplicates.py
+"""
+Check OCR_DEDUP_MAX_LOCAL_DIFF against real invoice pairs.
+
+    python manage.py calibrate_near_duplicates samples/
+    python manage.py calibrate_near_duplicates samples/ --margin 3
+
+Expected layout (one folder per group, files compared pairwise within it):
+
+    samples/copies/<group>/...      the same invoice: rescans, re-sent PDFs, phone photos
+    samples/different/<group>/...   different invoices printed from one supplier template
+
+Prints the local difference ranges per label, how many pairs the current
+threshold links, and the largest threshold that keeps --margin below the
+closest pair of different invoices.
+"""
+
+import itertools
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from app.gemini.near_duplicates import (
+    OCR_DEDUP_MAX_LOCAL_DIFF,
+    OCR_PHASH_MAX_DISTANCE,
+    decode_mask,
+    hamming,
+    image_fingerprint,
+    mask_difference,
+)
+
+LABELS = ("copies", "different")
+SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp", ".gif", ".pdf"}
+
+
+class Command(BaseCommand):
+    help = "Measure near-duplicate mask differences on labelled copy / same-template pairs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument(
+            "--margin", type=int, default=2,
+            help="Distance kept between the threshold and the closest different pair",
+        )
+
+    def handle(self, *args, **options):
+        root = Path(options["directory"])
+        pairs = {label: self._pairs(root / label) for label in LABELS}
+        if not pairs["different"]:
+            raise CommandError(f"No pairs under {root / 'different'}")
+
+        self.stdout.write(f"Current OCR_DEDUP_MAX_LOCAL_DIFF={OCR_DEDUP_MAX_LOCAL_DIFF}")
+        for label in LABELS:
+            if not pairs[label]:
+                continue
+            diffs = [d for _, _, d, _ in pairs[label]]
+            linked = sum(1 for d in diffs if d <= OCR_DEDUP_MAX_LOCAL_DIFF)
+            ms = np.mean([ms for *_, ms in pairs[label]])
+            self.stdout.write(
+                f"  {label:9s} {len(diffs):5d} pairs  min {min(diffs):5d}  "
+                f"median {np.median(diffs):7.1f}  max {max(diffs):5d}  "
+                f"linked {linked:5d}  ({ms:.0f} ms/pair)"
+            )
+
+        closest = sorted(pairs["different"], key=lambda p: p[2])
+        self.stdout.write("\nClosest different pairs:")
+        for a, b, diff, _ in closest[:10]:
+            self.stdout.write(f"  {diff:5d}  {a.parent.name}: {a.name} ↔ {b.name}")
+
+        suggested = max(0, closest[0][2] - options["margin"])
+        if pairs["copies"]:
+            linked = sum(1 for _, _, d, _ in pairs["copies"] if d <= suggested)
+            self.stdout.write(f"\nAt {suggested}: links {linked}/{len(pairs['copies'])} copy pairs, "
+                              f"no different pairs")
+        self.stdout.write(f"\nSuggested setting:\n  OCR_DEDUP_MAX_LOCAL_DIFF={suggested}")
+
+    def _pairs(self, folder: Path) -> list:
+        """[(path_a, path_b, local_diff, ms), ...] for pHash candidates within each group."""
+        if not folder.is_dir():
+            return []
+
+        pairs = []
+        for group in sorted(p for p in folder.iterdir() if p.is_dir()):
+            prints = []
+            for path in sorted(group.rglob("*")):
+                if path.suffix.lower() not in SUFFIXES:
+                    continue
+                fingerprint = image_fingerprint(path.read_bytes())
+                if fingerprint is None:
+                    self.stderr.write(f"⚠️ Skipping {path}")
+                    continue
+                prints.append((path, fingerprint[0], decode_mask(fingerprint[1])))
+
+            for (path_a, hash_a, mask_a), (path_b, hash_b, mask_b) in itertools.combinations(prints, 2):
+                if hamming(hash_a, hash_b) > OCR_PHASH_MAX_DISTANCE:
+                    continue   # never compared in production
+                start = time.perf_counter()
+                diff = mask_difference(mask_a, mask_b)
+                if diff is not None:
+                    pairs.append((path_a, path_b, diff, (time.perf_counter() - start) * 1000))
+        return pairs
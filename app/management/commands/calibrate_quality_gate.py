@@ -0,0 +1,117 @@
+# app/management/commands/calibrate_quality_gate.py
+"""
+Calibrate the pre-OCR quality gate on labelled samples.
+
+    python manage.py calibrate_quality_gate samples/
+    python manage.py calibrate_quality_gate samples/ --max-false-reject 0.02
+
+Expected layout (any depth below each label folder):
+
+    samples/accept/...   real invoices that must pass
+    samples/reject/...   blank pages, photos, logos, blurred captures
+
+Prints the current gate's confusion counts, per-statistic ranges per
+label, and suggested OCR_GATE_* values that reject at most
+--max-false-reject of the accepted samples.
+"""
+
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from app.gemini.image_prep import decode_image
+from app.gemini.quality_gate import (
+    OCR_GATE_DIM,
+    GATE_RULES,
+    failed_rule,
+    gate_thresholds,
+    image_stats,
+)
+
+LABELS = ("accept", "reject")
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp", ".gif"}
+
+
+class Command(BaseCommand):
+    help = "Calibrate OCR_GATE_* thresholds on a labelled accept/reject sample directory"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument(
+            "--max-false-reject", type=float, default=0.01,
+            help="Share of accepted samples each suggested threshold may reject",
+        )
+
+    def handle(self, *args, **options):
+        root = Path(options["directory"])
+        samples = {label: self._load(root / label) for label in LABELS}
+        if not samples["accept"]:
+            raise CommandError(f"No images under {root / 'accept'}")
+
+        current = gate_thresholds()
+        self.stdout.write(f"Gate thumbnail: {OCR_GATE_DIM}px")
+        self._confusion("Current thresholds", samples, current)
+
+        self.stdout.write("\nStatistic ranges (min / median / max):")
+        for stat in dict.fromkeys(rule[0] for rule in GATE_RULES):
+            for label in LABELS:
+                values = [s[stat] for _, s in samples[label]]
+                if values:
+                    self.stdout.write(
+                        f"  {stat:10s} {label:6s} "
+                        f"{min(values):10.4f} {np.median(values):10.4f} {max(values):10.4f}"
+                    )
+
+        suggested = self._suggest(samples["accept"], options["max_false_reject"])
+        self._confusion("\nSuggested thresholds", samples, suggested)
+
+        self.stdout.write("\nSuggested settings:")
+        for name, value in suggested.items():
+            self.stdout.write(f"  {name}={value:g}")
+
+    def _load(self, folder: Path) -> list:
+        if not folder.is_dir():
+            return []
+
+        loaded = []
+        for path in sorted(folder.rglob("*")):
+            if path.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            try:
+                img = decode_image(path.read_bytes())
+                start = time.perf_counter()
+                stats = image_stats(img)
+                stats["ms"] = (time.perf_counter() - start) * 1000
+                loaded.append((path, stats))
+            except Exception as e:
+                self.stderr.write(f"⚠️ Skipping {path}: {e}")
+        return loaded
+
+    def _suggest(self, accepted: list, max_false_reject: float) -> dict:
+        suggested = {}
+        for stat, direction, name, _ in GATE_RULES:
+            values = np.array([s[stat] for _, s in accepted])
+            if direction == "min":
+                suggested[name] = float(np.percentile(values, max_false_reject * 100))
+            else:
+                suggested[name] = float(np.percentile(values, 100 - max_false_reject * 100))
+            suggested[name] = round(suggested[name], 5)
+        return suggested
+
+    def _confusion(self, title: str, samples: dict, thresholds: dict):
+        self.stdout.write(f"{title}:")
+        for label in LABELS:
+            if not samples[label]:
+                continue
+            rejected = [(p, failed_rule(s, thresholds)) for p, s in samples[label]]
+            rejected = [(p, reason) for p, reason in rejected if reason]
+            ms = np.mean([s["ms"] for _, s in samples[label]])
+            self.stdout.write(
+                f"  {label:6s} {len(samples[label]):5d} samples  "
+                f"rejected {len(rejected):5d}  ({ms:.1f} ms/image)"
+            )
+            if label == "accept":
+                for path, reason in rejected[:10]:
+                    self.stdout.write(f"    ✗ {path.name}: {reason}")
@@ -0,0 +1,82 @@
+# app/management/commands/llm_loadtest.py
+"""
+Load-test the LLM dispatcher against the local fake endpoint (no network).
+
+    python manage.py llm_loadtest
+    python manage.py llm_loadtest --requests 1000 --fake-rpm 300 --fake-concurrency 8
+
+Prints throughput, latency percentiles, 429 / retry counts and how the
+AIMD concurrency limit moved. Dispatcher limits come from the usual
+LLM_* environment variables unless overridden here.
+"""
+
+import time
+import threading
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from app.gemini.llm_dispatcher import LLM_RPM, LLM_TPM, FakeGeminiBackend, LlmDispatcher
+
+
+class Command(BaseCommand):
+    help = "Drive the LLM dispatcher with synthetic prompts against a fake Gemini endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=300)
+        parser.add_argument("--prompt-chars", type=int, default=8000)
+        parser.add_argument("--rpm", type=int, default=LLM_RPM)
+        parser.add_argument("--tpm", type=int, default=LLM_TPM)
+        parser.add_argument("--fake-rpm", type=int, default=600)
+        parser.add_argument("--fake-concurrency", type=int, default=16)
+        parser.add_argument("--fake-latency", type=float, default=2.0, help="Seconds per call at no load")
+        parser.add_argument("--fake-error-rate", type=float, default=0.01)
+
+    def handle(self, *args, **options):
+        backend = FakeGeminiBackend(
+            rpm=options["fake_rpm"],
+            max_concurrency=options["fake_concurrency"],
+            latency_s=options["fake_latency"],
+            error_rate=options["fake_error_rate"],
+        )
+        dispatcher = LlmDispatcher(backend, rpm=options["rpm"], tpm=options["tpm"])
+        prompt = "x" * options["prompt_chars"]
+
+        latencies = []
+        limits = []
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(1.0):
+                limits.append(dispatcher.snapshot()["concurrency"])
+
+        started = time.monotonic()
+        futures = []
+        for _ in range(options["requests"]):
+            submitted = time.monotonic()
+            future = dispatcher.submit(prompt)
+            future.add_done_callback(lambda f, t=submitted: latencies.append(time.monotonic() - t))
+            futures.append(future)
+
+        threading.Thread(target=sample, daemon=True).start()
+        wait(futures)
+        done.set()
+        elapsed = time.monotonic() - started
+
+        failed = sum(1 for f in futures if f.exception() is not None)
+        latencies.sort()
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        stats = dispatcher.snapshot()
+        limits = [l for l in limits if l is not None]
+        self.stdout.write(f"Requests:    {len(futures)} in {elapsed:.1f}s "
+                          f"({len(futures) / elapsed * 60:.0f}/min), failed {failed}")
+        self.stdout.write(f"Latency:     p50 {pct(0.5):.1f}s  p95 {pct(0.95):.1f}s  max {pct(1.0):.1f}s "
+                          f"(queueing included)")
+        self.stdout.write(f"Calls:       {stats['calls']}  overloads {stats['overloads']}  "
+                          f"retries {stats['retries']}")
+        if limits:
+            self.stdout.write(f"Concurrency: min {min(limits):.1f}  max {max(limits):.1f}  "
+                              f"final {stats['concurrency']}")
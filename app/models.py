@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 from django.core.validators import RegexValidator
+from django.utils import timezone
 from crum import get_current_user
 
 # -----------------TimeStamp------------------
@@ -188,11 +189,23 @@ class ExtractionBatch(AuditModel):
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    # Re-extract mode: prompt → Gemini → store on the saved OCR text only
+    reextract_status = models.CharField(max_length=20, choices=STATUS_CHOICES, null=True, blank=True)
+    reextract_total_count = models.IntegerField(default=0)
+    reextract_processed_count = models.IntegerField(default=0)
+    reextract_started_at = models.DateTimeField(null=True, blank=True)
+    reextract_completed_at = models.DateTimeField(null=True, blank=True)
+
     @property
     def progress_percentage(self):
         if self.total_count == 0: return 0
         return round((self.processed_count / self.total_count) * 100, 2)
 
+    @property
+    def reextract_progress_percentage(self):
+        if self.reextract_total_count == 0: return 0
+        return round((self.reextract_processed_count / self.reextract_total_count) * 100, 2)
+
 # -------------------  DETAIL MODEL -------------------
 class InvoiceExtraction(AuditModel):
     batch_master = models.ForeignKey(
@@ -210,5 +223,32 @@ class InvoiceExtraction(AuditModel):
     invoice_date = models.DateField(null=True, blank=True)
     invoice_amount = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
     extracted_data = models.JSONField(default=dict)
+    ocr_metrics = models.JSONField(default=dict, blank=True)
+    ocr_layout = models.BinaryField(null=True, blank=True)   # see app/gemini/ocr_layout.py
+    ocr_text = models.BinaryField(null=True, blank=True)     # compressed, see app/gemini/blob_codec.py
+    image_phash = models.CharField(max_length=16, null=True, blank=True, db_index=True)
+    image_signature = models.BinaryField(null=True, blank=True)
+    duplicate_of = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        related_name="near_duplicates",
+        null=True,
+        blank=True
+    )
     duplicate_fingerprint = models.CharField(max_length=255, unique=True)
-    status = models.CharField(max_length=20, default="SUCCESS")
\ No newline at end of file
+    status = models.CharField(max_length=20, default="SUCCESS")
+
+
+# ------------------- LLM RESPONSE CACHE -------------------
+class LlmResponseCache(models.Model):
+    """Validated Gemini extraction per (OCR text, compiled prompt, model)."""
+    cache_key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=100)
+    prompt_hash = models.CharField(max_length=64, default="")
+    response = models.JSONField(default=dict)
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        db_table = 'llm_response_cache'
@@ -1,7 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import Role, UserProfile, UserRole
+from .models import Role, UserProfile, UserRole, CustomExtractionField
 
 User = get_user_model()
 
@@ -24,4 +24,11 @@ def create_superuser_profile(sender, instance, created, **kwargs):
             role=role,
             defaults={'created_by': instance}
         )
-        print('UserRole assigned successfully')
\ No newline at end of file
+        print('UserRole assigned successfully')
+
+
+@receiver(post_save, sender=CustomExtractionField)
+@receiver(post_delete, sender=CustomExtractionField)
+def invalidate_extraction_schema_cache(sender, **kwargs):
+    from app.gemini.builder import invalidate_extraction_schema
+    invalidate_extraction_schema()
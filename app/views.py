@@ -651,7 +651,7 @@ def upload_management_delete(request, batch_id):
 ################ Invoice  Extraction ######################
 
 # Import invoice processing logic from gemini module
-from app.gemini.invoice_processor import process_invoices_parallel
+from app.gemini.invoice_processor import process_invoices_parallel, reextract_invoices_parallel
 
 @login_required(login_url="/")
 def invoice_extraction(request):
@@ -739,9 +739,47 @@ def get_extraction_progress(request, extraction_batch_id):
     return JsonResponse({
         "success": True, "batch_status": master.status, "progress_percentage": master.progress_percentage,
         "processed": master.processed_count, "total": master.total_count,
-        "stats": {"success": stats['s'], "duplicate": stats['d'], "failed": stats['f']}
+        "stats": {"success": stats['s'], "duplicate": stats['d'], "failed": stats['f']},
+        "reextract": {
+            "status": master.reextract_status, "progress_percentage": master.reextract_progress_percentage,
+            "processed": master.reextract_processed_count, "total": master.reextract_total_count,
+        }
     })
 
+
+@login_required(login_url="/")
+@require_POST
+def start_invoice_reextraction(request):
+    """Re-run Gemini on a finished batch from its saved OCR text (no re-download / re-OCR)."""
+    try:
+        batch_id = json.loads(request.body.decode("utf-8"))["batch_id"]
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({"success": False, "message": "Invalid request body"}, status=400)
+
+    master = get_object_or_404(ExtractionBatch, extraction_batch_id=batch_id, created_by=request.user)
+
+    if not master.invoices.filter(ocr_text__isnull=False).exists():
+        return JsonResponse({"success": False, "message": "No saved OCR text for this batch"}, status=404)
+
+    # Claim the batch in one conditional UPDATE so two quick POSTs cannot both start a run
+    claimed = (
+        ExtractionBatch.objects
+        .filter(pk=master.pk)
+        .exclude(status="PROCESSING")
+        .exclude(reextract_status="PROCESSING")
+        .update(reextract_status="PROCESSING")
+    )
+    if claimed != 1:
+        return JsonResponse({"success": False, "message": "Batch is still processing"}, status=400)
+
+    threading.Thread(
+        target=reextract_invoices_parallel,
+        args=(master.id,),
+        daemon=True
+    ).start()
+
+    return JsonResponse({"success": True, "extraction_batch_id": master.extraction_batch_id})
+
 @login_required(login_url="/")
 def invoice_extraction_list(request):
     qs = ExtractionBatch.objects.filter(created_by=request.user).order_by("-created_at")
@@ -0,0 +1,105 @@
+"""
+Benchmark: Paddle Inference vs ONNX Runtime OCR backends
+Reports images/second and peak RSS per backend on this machine.
+
+    python bench_ocr_backend.py img1.jpg img2.png ...
+    python bench_ocr_backend.py --repeat 3 --backends paddle onnx samples/*.jpg
+
+Each backend runs in a fresh subprocess (one engine, in-process OCR,
+cache off) so RSS figures are not polluted by the other backend.
+ONNX models must already be exported to OCR_ONNX_DIR (see
+app/gemini/onnx_backend.py).
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+    except ImportError:  # Windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+
+
+def run_worker(paths, repeat):
+    from app.gemini.ocr_engine import decode_image, ocr_page, preprocess, warmup
+
+    images = []
+    for path in paths:
+        with open(path, "rb") as fh:
+            images.append(preprocess(decode_image(fh.read())))
+
+    load_start = time.perf_counter()
+    warmup()
+    load_seconds = time.perf_counter() - load_start
+
+    ocr_page(images[0])  # first-inference allocations
+
+    lines = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for img in images:
+            lines += len(ocr_page(img).lines)
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "images_per_sec": len(images) * repeat / elapsed,
+        "load_seconds": load_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        "lines": lines // repeat,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=["paddle", "onnx"])
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        return run_worker(args.images, args.repeat)
+
+    print("=" * 60)
+    print(f"OCR BACKEND BENCHMARK – {len(args.images)} images x {args.repeat}")
+    print("=" * 60)
+
+    for backend in args.backends:
+        env = dict(
+            os.environ,
+            OCR_BACKEND=backend,
+            OCR_POOL_SIZE="1",
+            OCR_WORKER_PROCESSES="0",
+            OCR_CACHE_ENABLED="0",
+            OCR_ROUTING="0",   # paddle-only; would load extra engines on one side
+        )
+        proc = subprocess.run(
+            [sys.executable, __file__, "--worker", "--repeat", str(args.repeat), *args.images],
+            env=env, capture_output=True, text=True,
+        )
+
+        if proc.returncode != 0:
+            print(f"{backend:8s} ❌ failed:\n{proc.stderr[-2000:]}")
+            continue
+
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(
+            f"{backend:8s} {r['images_per_sec']:7.2f} img/s   "
+            f"peak RSS {r['peak_rss_mb']:7.1f} MB   "
+            f"load {r['load_seconds']:5.1f} s   lines/pass {r['lines']}"
+        )
+
+
+if __name__ == "__main__":
+    main()